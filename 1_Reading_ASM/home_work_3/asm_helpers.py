@@ -1,6 +1,7 @@
-from enum import Enum
+import struct
+from enum import Enum, IntEnum
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 
 RED = "\033[31m"
@@ -47,9 +48,6 @@ MEMORY_MODE = {
     '111':('bx'),
 }
 
-def string_insert(original:str, substring:str, index:int):
-    return original[:index] + substring + original[index:]
-
 class Opcode(Enum):
     UNKNOWN = 0
     MOV = 1
@@ -84,6 +82,12 @@ reg_opcode_table = {
     "111": Opcode.CMP,
 
 }
+# the same tables indexed by the 3 bit field as an int, for the integer decoder
+REGISTERS_WORD = tuple(REGISTER_MODE_WORD[format(code, '03b')] for code in range(8))
+REGISTERS_BYTE = tuple(REGISTER_MODE_BYTE[format(code, '03b')] for code in range(8))
+EFFECTIVE_ADDRESSES = tuple(MEMORY_MODE[format(code, '03b')] for code in range(8))
+REG_OPCODES = tuple(reg_opcode_table.get(format(code, '03b')) for code in range(8))
+
 class OpCodes:
     def __init__(self):
         self.table = OPCODE_TABLE
@@ -91,12 +95,86 @@ class OpCodes:
     def get(self, opcode_name):
         return self.table.get(opcode_name, Opcode.UNKNOWN)
     
-@dataclass
+class OperandKind(IntEnum):
+    # every operand is a (kind, a, b) tuple of ints, text only gets built when printed
+    UNKNOWN = 0
+    REGISTER = 1       # a = 3 bit register code, b = wide
+    MEMORY = 2         # a = 3 bit rm code or -1 for a direct address, b = displacement
+    MEMORY_SIGNED = 3  # same as MEMORY but a negative displacement prints as '- n'
+    DIRECT = 4         # a = address, always printed even when it is 0
+    IMMEDIATE = 5      # a = value, b = one of IMMEDIATE_SIZES
+
+IMMEDIATE_SIZES = ('', 'byte ', 'word ')
+DIRECT_ADDRESS = -1
+
+def format_operand(operand: tuple[int, int, int]) -> str:
+    kind, a, b = operand
+    if kind == OperandKind.REGISTER:
+        return REGISTERS_WORD[a] if b else REGISTERS_BYTE[a]
+    if kind == OperandKind.IMMEDIATE:
+        return IMMEDIATE_SIZES[b] + str(a)
+    if kind == OperandKind.DIRECT:
+        return f"[{a}]"
+    if kind == OperandKind.UNKNOWN:
+        return '?'
+
+    terms = () if a == DIRECT_ADDRESS else EFFECTIVE_ADDRESSES[a]
+    if isinstance(terms, str):
+        terms = (terms,)
+    if b:
+        terms = terms + (b,)
+    text = '[' + ' + '.join(str(term) for term in terms) + ']'
+    if kind == OperandKind.MEMORY_SIGNED:
+        text = text.replace('+ -', '- ')
+    return text
+
+@dataclass(slots=True)
 class Instruction:
+    """
+    One decoded instruction, all ints and shared references. The bytes are not
+    copied, offset and length point into source, the buffer the decoder ran
+    over. Up to two operands are stored inline as kind/a/b, see OperandKind,
+    kind1 is None for instructions with a single operand.
+    """
     opcode: Opcode
-    args: list[str]
-    literal_bytes: bytes
-    formatted_bytes: str = ''
+    source: bytes = field(repr=False)
+    offset: int
+    length: int
+    style: list[tuple[str, int]] = field(default=None, repr=False)
+    kind0: OperandKind = None
+    a0: int = 0
+    b0: int = 0
+    kind1: OperandKind = None
+    a1: int = 0
+    b1: int = 0
+
+    @classmethod
+    def from_operands(cls, opcode: Opcode, operands, source: bytes, offset: int, length: int, style=None):
+        if len(operands) == 2:
+            (kind0, a0, b0), (kind1, a1, b1) = operands
+            return cls(opcode, source, offset, length, style, kind0, a0, b0, kind1, a1, b1)
+        (kind0, a0, b0), = operands
+        return cls(opcode, source, offset, length, style, kind0, a0, b0)
+
+    @property
+    def operands(self) -> tuple[tuple[int, int, int], ...]:
+        if self.kind1 is None:
+            return ((self.kind0, self.a0, self.b0),)
+        return ((self.kind0, self.a0, self.b0), (self.kind1, self.a1, self.b1))
+
+    @property
+    def literal_bytes(self) -> bytes:
+        return self.source[self.offset:self.offset + self.length]
+
+    @property
+    def args(self) -> list[str]:
+        return [format_operand(operand) for operand in self.operands]
+
+    @property
+    def formatted_bytes(self) -> str:
+        if not self.style:
+            return ''
+        return byte_formatter(self.literal_bytes, self.style)
     
     def __str__(self):
        return f"{self.opcode.name.lower()} {', '.join(self.args)}"
@@ -104,34 +182,25 @@ class Instruction:
     def debug_repr(self):
         binary_content = ' '.join(format(byte, '08b') for byte in self.literal_bytes)
         binary_content_len = len(binary_content)
-        if self.formatted_bytes:
-            binary_content = self.formatted_bytes
+        formatted_bytes = self.formatted_bytes
+        if formatted_bytes:
+            binary_content = formatted_bytes
         content_len = len(self.__str__()) + binary_content_len
         padding = 85 - content_len
         return f"{self.__str__()} {' ' * padding}{binary_content}"
 
 def byte_formatter(raw_bytes, style: list[tuple[str, int]]):
     bytes_as_string = ', '.join(format(byte, '08b') for byte in raw_bytes)
-    offset = 0
-    for style_step in style:
-        index = style_step[1]+offset
-        color = style_step[0]
-        bytes_as_string = string_insert(bytes_as_string, style_step[0], index)
-        offset += len(color)
-    return bytes_as_string + RESET
-
-def bytes_to_int(*bytes_as_str) -> int:
-    if not bytes_as_str:
-        return -808080808
-    bytes_as_str = reversed((bytes_as_str))
-    long_str = ''.join(bytes_as_str)
-    bit_width = len(long_str)
-    unsigned_value = int(long_str, 2)
-    if unsigned_value & (1 << (bit_width - 1)):
-        # two's complement value for signed number
-        signed_value = unsigned_value - (1 << bit_width)
-    else:
-        signed_value = unsigned_value
-    
-    return signed_value
+    # style indexes are positions in the plain string, cut it there once
+    pieces = []
+    last_index = 0
+    for color, index in style:
+        pieces.append(bytes_as_string[last_index:index])
+        pieces.append(color)
+        last_index = index
+    pieces.append(bytes_as_string[last_index:])
+    pieces.append(RESET)
+    return ''.join(pieces)
 
+# 16 bit little endian displacements and immediates, the Decoder unpacks with it
+S16 = struct.Struct('<h')
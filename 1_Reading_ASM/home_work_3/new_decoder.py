@@ -1,144 +1,137 @@
+import struct
 from asm_helpers import*
 
 opcode_table = OpCodes()
+unpack_s16 = S16.unpack_from
+
+# first byte prefixes, matched against the 8 character bit string once while
+# DISPATCH is built, decoding itself never formats a byte as a string
+JUMP_PREFIXES = ['0111010', '0111110', '0111111', '0111001', '0111011', '0111101', '0111000', '0111100', '1110001', '1110000']
+MOD_REG_RM_PREFIXES = ["100010", "000000", "000110", "001110", "001010"]
+MEMORY_TO_ACCUMULATOR_PREFIXES = ["101000"]
+OPERATOR_PREFIXES = ["100000"] # this is operator territory
+IMMEDIATE_TO_ACCUMULATOR_PREFIXES = ["0000010", "0010110", "0011110"]
+IMMEDIATE_REG_MEM_PREFIXES = ["1100011"]
+
 class Decoder:
     def __init__(self, bin:bytes):
         self._bin = bin
+        # signed view of the same bytes, indexing it gives an 8 bit displacement directly
+        self._signed_bytes = memoryview(bin).cast('b')
         self.asm_instructions: list[Instruction] = []
-        last_byte = ''
         self._current = 0
         self._at_end: bool = False
-    
-    @property
-    def this_byte(self):
-        return format(self._bin[self._current], '08b')
 
-    def _advance(self) -> str:
-        self.last_byte = self.this_byte
+    def _advance(self) -> int:
+        byte = self._bin[self._current]
+        self._current += 1
+        return byte
+
+    def _read_s8(self) -> int:
+        value = self._signed_bytes[self._current]
         self._current += 1
-        return self.last_byte
+        return value
+
+    def _read_s16(self) -> int:
+        try:
+            value = unpack_s16(self._bin, self._current)[0]
+        except struct.error:
+            raise IndexError(f"operand at {self._current} runs past the end of the input") from None
+        self._current += 2
+        return value
 
     def _is_at_end(self):
        return self._current >= len(self._bin)
 
-    def add_instruction(self, opcode: Opcode, args, style:list[tuple[str, int]] = None):
-        args = [str(arg) for arg in args]
-        literal_bytes = self._bin[self._start:self._current] # AKA lexeme
-        formatted_bytes = ''
-        if style:
-            formatted_bytes = byte_formatter(literal_bytes, style)
-        self.asm_instructions.append(Instruction(opcode, args, literal_bytes, formatted_bytes))
-    
-    def mod_reg_rm(self, immediate=False, operator=False):
-            direction = bool(int(self.last_byte[6]))
-            wide = bool(int(self.last_byte[7]))
+    def add_instruction(self, opcode: Opcode, operands, style:list[tuple[str, int]] = None):
+        # operands stay ints and the bytes stay in self._bin, Instruction
+        # builds the text and colors if it is printed
+        self.asm_instructions.append(Instruction.from_operands(
+            opcode, operands, self._bin, self._start, self._current - self._start, style
+        ))
+
+    def mod_reg_rm(self, first_byte: int, immediate=False, operator=False):
+            direction = first_byte & 0b10
+            wide = first_byte & 0b01
             second_byte = self._advance()
-            mode = second_byte[:2]
-            reg_code = second_byte[2:5]
-            rm_code = second_byte[5:]
+            mode = second_byte >> 6
+            reg_code = (second_byte >> 3) & 0b111
+            rm_code = second_byte & 0b111
             displacement = 0
-            rm = MEMORY_MODE[rm_code][:]
 
-            if mode == '00':
-                if rm_code == '110': # I think this is a solution
+            if mode == 0b00:
+                if rm_code == 0b110: # I think this is a solution
                     if not immediate:
-                        rm = tuple()
-                    displacement = bytes_to_int(self._advance(), self._advance())
-            if mode == '01': # Memory Mode: 8-bit displacement
-                displacement = bytes_to_int(self._advance())
-            elif mode == '10': # Memory Mode: 16-bit displacement
-                displacement = bytes_to_int(self._advance(), self._advance())
-
-            if isinstance(rm, tuple):
-                if displacement:
-                    rm = rm + (displacement,)
-                rm = '[' + ' + '.join(str(operand) for operand in rm) + ']'
+                        rm_code = DIRECT_ADDRESS
+                    displacement = self._read_s16()
+            if mode == 0b01: # Memory Mode: 8-bit displacement
+                displacement = self._read_s8()
+            elif mode == 0b10: # Memory Mode: 16-bit displacement
+                displacement = self._read_s16()
+
+            if mode == 0b11: # Register Mode: No displacement
+                rm = (OperandKind.REGISTER, rm_code, wide)
+            elif immediate:
+                rm = (OperandKind.MEMORY, rm_code, displacement)
             else:
-                if displacement:
-                    rm = f"{rm} + {displacement}"
-                rm = '[' + rm + ']'
+                rm = (OperandKind.MEMORY_SIGNED, rm_code, displacement)
 
-            if mode == '11': # Register Mode: No displacement
-                if wide:
-                    rm = REGISTER_MODE_WORD[rm_code]
-                else:
-                    rm = REGISTER_MODE_BYTE[rm_code]
-    
             if immediate and not operator:
                 if wide:
-                    value = 'word ' + str(bytes_to_int(self._advance(), self._advance()))
+                    value = (OperandKind.IMMEDIATE, self._read_s16(), 2)
                 else:
-                    value = 'byte ' + str(bytes_to_int(self._advance()))
+                    value = (OperandKind.IMMEDIATE, self._read_s8(), 1)
                 return [rm, value]
-    
+
             elif operator:
-                value = str(bytes_to_int(self._advance()))
+                value = (OperandKind.IMMEDIATE, self._read_s8(), 0)
                 return [rm, value], reg_code
-            
+
             else:
-                if wide:
-                    reg = REGISTER_MODE_WORD[reg_code]
-                else:
-                    reg = REGISTER_MODE_BYTE[reg_code]
-                rm = rm.replace('+ -', '- ')
-                args = [reg, rm]
+                reg = (OperandKind.REGISTER, reg_code, wide)
                 if not direction:
-                    args = reversed(args)
-                return args
+                    return [rm, reg]
+                return [reg, rm]
 
-    def memory_to_accumulator(self):
-        # elif this_byte_as_bin[:7] in ["1010000", "1010001"]: # MOV Memory to accumulator
-        direction = bool(int(self.last_byte[6]))
-        wide = bool(int(self.last_byte[7]))
+    def memory_to_accumulator(self, first_byte: int):
+        direction = first_byte & 0b10
+        wide = first_byte & 0b01
         if wide:
-            register = 'ax'
-            address = str(bytes_to_int(self._advance(), self._advance()))
-            address = '[' + str(address) + ']'
+            register = (OperandKind.REGISTER, 0b000, 1) # ax
+            address = (OperandKind.DIRECT, self._read_s16(), 0)
         else:
-            register = 'al'
-            address = bytes_to_int(self._advance())
-            address = '[' + str(address) + ']'
-        args = [register, address]
+            register = (OperandKind.REGISTER, 0b000, 0) # al
+            address = (OperandKind.DIRECT, self._read_s8(), 0)
         if direction:
-            args = reversed(args)
-        return args
+            return [address, register]
+        return [register, address]
 
-    def scan_instruction(self):
-        style = MYSTERY
-        opcode = Opcode.UNKNOWN
-        args = ['?']
-
-        self._advance()
-        if self.last_byte[:7] in ['0111010', '0111110', '0111111', '0111001', '0111011', '0111101', '0111000', '0111100', '1110001', '1110000']:
-            style = FIRST_MOV
-            opcode = Opcode.JZN
-            args = [bytes_to_int(self._advance())]
-
-        elif self.last_byte[:6] in ["100010", "000000", "000110", "001110", "001010"]:
-            style = FIRST_MOV
-            opcode = opcode_table.get(self.last_byte[:6])
-            args = self.mod_reg_rm()
-        
-        elif self.last_byte[:6] in ["101000"]:
-            style = FIRST_MOV
-            opcode = opcode_table.get(self.last_byte[:6])
-            args = self.memory_to_accumulator()
-
-        elif self.last_byte[:6] in ["100000"]: # this is operator territory 
-            style = FIRST_MOV
-            args, reg = self.mod_reg_rm(immediate=True, operator=True)
-            opcode = reg_opcode_table.get(reg)
-
-        elif self.last_byte[:7] in ["0000010", "0010110", "0011110"]: # immediate to accumulator
-            style = ACCUMULATOR_MOV
-            opcode = opcode_table.get(self.last_byte[:7])
-            args = self.memory_to_accumulator()
-            
-        elif self.last_byte[:7] in ["1100011"]: 
-            style = IMMEDIATE_REG_MEM_MOV
-            opcode = opcode_table.get(self.last_byte[:7])
-            args = self.mod_reg_rm(immediate=True)
+    # one handler per instruction family, each takes the first byte and the
+    # opcode DISPATCH found for it and returns (opcode, args)
+
+    def _jump(self, first_byte: int, opcode: Opcode):
+        return opcode, [(OperandKind.IMMEDIATE, self._read_s8(), 0)]
+
+    def _mod_reg_rm(self, first_byte: int, opcode: Opcode):
+        return opcode, self.mod_reg_rm(first_byte)
+
+    def _memory_to_accumulator(self, first_byte: int, opcode: Opcode):
+        return opcode, self.memory_to_accumulator(first_byte)
+
+    def _operator(self, first_byte: int, opcode: Opcode):
+        args, reg_code = self.mod_reg_rm(first_byte, immediate=True, operator=True)
+        return REG_OPCODES[reg_code], args
+
+    def _immediate_reg_mem(self, first_byte: int, opcode: Opcode):
+        return opcode, self.mod_reg_rm(first_byte, immediate=True)
 
+    def _unknown(self, first_byte: int, opcode: Opcode):
+        return opcode, [(OperandKind.UNKNOWN, 0, 0)]
+
+    def scan_instruction(self):
+        first_byte = self._advance()
+        handler, opcode, style = DISPATCH[first_byte]
+        opcode, args = handler(self, first_byte, opcode)
         self.add_instruction(opcode, args, style)
 
     def scan_instructions(self):
@@ -149,5 +142,31 @@ class Decoder:
             # except Exception as e:
             #     print(e)
             #     break
-                
-        return self.asm_instructions
\ No newline at end of file
+
+        return self.asm_instructions
+
+def _build_dispatch() -> list[tuple]:
+    """
+    256 entries of (handler, opcode, style), one for every possible first byte.
+    """
+    dispatch = []
+    for first_byte in range(256):
+        bits = format(first_byte, '08b')
+        if bits[:7] in JUMP_PREFIXES:
+            entry = (Decoder._jump, Opcode.JZN, FIRST_MOV)
+        elif bits[:6] in MOD_REG_RM_PREFIXES:
+            entry = (Decoder._mod_reg_rm, opcode_table.get(bits[:6]), FIRST_MOV)
+        elif bits[:6] in MEMORY_TO_ACCUMULATOR_PREFIXES:
+            entry = (Decoder._memory_to_accumulator, opcode_table.get(bits[:6]), FIRST_MOV)
+        elif bits[:6] in OPERATOR_PREFIXES:
+            entry = (Decoder._operator, None, FIRST_MOV) # the opcode lives in the reg field
+        elif bits[:7] in IMMEDIATE_TO_ACCUMULATOR_PREFIXES:
+            entry = (Decoder._memory_to_accumulator, opcode_table.get(bits[:7]), ACCUMULATOR_MOV)
+        elif bits[:7] in IMMEDIATE_REG_MEM_PREFIXES:
+            entry = (Decoder._immediate_reg_mem, opcode_table.get(bits[:7]), IMMEDIATE_REG_MEM_MOV)
+        else:
+            entry = (Decoder._unknown, Opcode.UNKNOWN, MYSTERY)
+        dispatch.append(entry)
+    return dispatch
+
+DISPATCH = _build_dispatch()
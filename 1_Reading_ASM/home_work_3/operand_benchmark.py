@@ -0,0 +1,77 @@
+import struct
+import timeit
+
+from asm_helpers import S16
+
+# struct based operand readers the Decoder's reads were measured against
+S8 = struct.Struct('<b')
+U8 = struct.Struct('<B')
+U16 = struct.Struct('<H')
+_OPERAND_STRUCTS = {(False, True): S8, (False, False): U8, (True, True): S16, (True, False): U16}
+_OPERAND_RUN_STRUCTS: dict[tuple[int, bool, bool], struct.Struct] = {}
+
+def read_operand(source, offset: int, wide: bool = False, signed: bool = True) -> int:
+    """
+    One 8 or 16 bit displacement/immediate at source[offset], source being the
+    instruction bytes or a memoryview over them.
+    """
+    try:
+        return _OPERAND_STRUCTS[wide, signed].unpack_from(source, offset)[0]
+    except struct.error:
+        raise IndexError(f"operand at {offset} runs past the end of the input") from None
+
+def read_operands(source, offset: int, count: int, wide: bool = False, signed: bool = True) -> tuple[int, ...]:
+    """
+    count back to back operands starting at source[offset] in one unpack.
+    """
+    key = (count, wide, signed)
+    run = _OPERAND_RUN_STRUCTS.get(key)
+    if run is None:
+        code = _OPERAND_STRUCTS[wide, signed].format[-1]
+        run = _OPERAND_RUN_STRUCTS[key] = struct.Struct(f'<{count}{code}')
+    try:
+        return run.unpack_from(source, offset)
+    except struct.error:
+        raise IndexError(f"operands at {offset} run past the end of the input") from None
+
+# what displacements and immediates used to go through: every byte formatted
+# as a bit string, the strings joined and parsed back with int(s, 2)
+def string_bytes_to_int(*bytes_as_str) -> int:
+    long_str = ''.join(reversed(bytes_as_str))
+    bit_width = len(long_str)
+    unsigned_value = int(long_str, 2)
+    if unsigned_value & (1 << (bit_width - 1)):
+        return unsigned_value - (1 << bit_width)
+    return unsigned_value
+
+def per_operand_ns(stmt, number=200_000, per_call=1, **names):
+    seconds = min(timeit.repeat(stmt, globals=names, number=number, repeat=5))
+    return seconds / number / per_call * 1e9
+
+if __name__ == "__main__":
+    source = bytes(range(256)) * 16
+    signed_bytes = memoryview(source).cast('b')
+    unpack_s16 = S16.unpack_from
+    run_length = 64
+    names = dict(
+        source=source,
+        signed_bytes=signed_bytes,
+        unpack_s16=unpack_s16,
+        string_bytes_to_int=string_bytes_to_int,
+        read_operand=read_operand,
+        read_operands=read_operands,
+        run_length=run_length,
+    )
+
+    results = [
+        ("s8  bit strings + int(s, 2)", per_operand_ns("string_bytes_to_int(format(source[129], '08b'))", **names)),
+        ("s8  read_operand", per_operand_ns("read_operand(source, 129)", **names)),
+        ("s8  signed memoryview (Decoder)", per_operand_ns("signed_bytes[129]", **names)),
+        ("s8  read_operands run of 64", per_operand_ns("read_operands(source, 129, run_length)", per_call=run_length, **names)),
+        ("s16 bit strings + int(s, 2)", per_operand_ns("string_bytes_to_int(format(source[129], '08b'), format(source[130], '08b'))", **names)),
+        ("s16 read_operand", per_operand_ns("read_operand(source, 129, wide=True)", **names)),
+        ("s16 precompiled Struct('<h') (Decoder)", per_operand_ns("unpack_s16(source, 129)[0]", **names)),
+        ("s16 read_operands run of 64", per_operand_ns("read_operands(source, 129, run_length, wide=True)", per_call=run_length, **names)),
+    ]
+    for name, ns in results:
+        print(f"{name:<42} {ns:8.1f} ns/operand")
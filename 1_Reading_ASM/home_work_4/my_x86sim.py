@@ -3,6 +3,33 @@ from dataclasses import dataclass, field
 
 import sim86
 
+class DecodeCache:
+    """
+    Decoded instructions keyed by the offset they start at, so a loop body is
+    only run through sim86 once. This VM has no memory to write code through,
+    so entries never go stale.
+    """
+    def __init__(self, code: bytes):
+        self.code = code
+        self.entries: dict[int, sim86.Instruction] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, offset: int) -> sim86.Instruction:
+        decoded = self.entries.get(offset)
+        if decoded is not None:
+            self.hits += 1
+            return decoded
+
+        self.misses += 1
+        decoded = sim86.decode_8086_instruction(self.code, offset)
+        if decoded.op != sim86.OperationType.none:
+            self.entries[offset] = decoded
+        return decoded
+
+    def stats(self) -> str:
+        return f"decode cache: {self.hits} hits, {self.misses} misses"
+
 class VirtualMachine:
     def __init__(self):
         self.registers = [0 for x in range(12)] 
@@ -73,9 +100,10 @@ if __name__ == "__main__":
         with Path(bin_path_as_str).open('rb') as f:
             bin = f.read()
             offset = 0
+            decode_cache = DecodeCache(bin)
 
             while offset < len(bin):
-                decoded = sim86.decode_8086_instruction(bin, offset)
+                decoded = decode_cache.decode(offset)
                 if decoded.op != sim86.OperationType.none:
                     last_offset = offset
                     offset += decoded.size
@@ -92,6 +120,7 @@ if __name__ == "__main__":
                     print("unrecognized instruction")
                     break
             vm.print_registers()
+            print(decode_cache.stats())
 
     except FileNotFoundError:
             print(f"Error: File not found at {bin_path_as_str}")
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+8086 clock estimates, taken from the instruction timing tables in the 8086
+family user's manual. Only the instructions the VM runs are covered, anything
+else is counted as 0 clocks.
+"""
+from dataclasses import dataclass
+
+import sim86
+
+Op = sim86.OperationType
+
+# operand kinds for the timing tables
+REGISTER = 'reg'
+MEMORY = 'mem'
+IMMEDIATE = 'imm'
+ACCUMULATOR = 'acc'
+
+# (op, destination kind, source kind) -> (base clocks, word transfers to memory)
+# every transfer costs ODD_TRANSFER_PENALTY more when its word sits at an odd address
+BASE_CLOCKS = {
+    (Op.mov, REGISTER, REGISTER): (2, 0),
+    (Op.mov, REGISTER, MEMORY): (8, 1),
+    (Op.mov, MEMORY, REGISTER): (9, 1),
+    (Op.mov, REGISTER, IMMEDIATE): (4, 0),
+    (Op.mov, MEMORY, IMMEDIATE): (10, 1),
+    (Op.mov, ACCUMULATOR, MEMORY): (10, 1),
+    (Op.mov, MEMORY, ACCUMULATOR): (10, 1),
+    (Op.add, REGISTER, REGISTER): (3, 0),
+    (Op.add, REGISTER, MEMORY): (9, 1),
+    (Op.add, MEMORY, REGISTER): (16, 2),
+    (Op.add, REGISTER, IMMEDIATE): (4, 0),
+    (Op.add, MEMORY, IMMEDIATE): (17, 2),
+    (Op.sub, REGISTER, REGISTER): (3, 0),
+    (Op.sub, REGISTER, MEMORY): (9, 1),
+    (Op.sub, MEMORY, REGISTER): (16, 2),
+    (Op.sub, REGISTER, IMMEDIATE): (4, 0),
+    (Op.sub, MEMORY, IMMEDIATE): (17, 2),
+    (Op.cmp, REGISTER, REGISTER): (3, 0),
+    (Op.cmp, REGISTER, MEMORY): (9, 1),
+    (Op.cmp, MEMORY, REGISTER): (9, 1),
+    (Op.cmp, REGISTER, IMMEDIATE): (4, 0),
+    (Op.cmp, MEMORY, IMMEDIATE): (10, 1),
+}
+
+# op -> (clocks when the branch is taken, clocks when it is not)
+BRANCH_CLOCKS = {
+    Op.jmp: (15, 15),
+    Op.loop: (17, 5),
+    Op.loopz: (18, 6),
+    Op.loopnz: (19, 5),
+    Op.jcxz: (18, 6),
+}
+for _op in (Op.je, Op.jne, Op.jl, Op.jnl, Op.jle, Op.jg, Op.jb, Op.jnb,
+            Op.jbe, Op.ja, Op.jp, Op.jnp, Op.jo, Op.jno, Op.js, Op.jns):
+    BRANCH_CLOCKS[_op] = (16, 4)
+
+ODD_TRANSFER_PENALTY = 4
+SEGMENT_OVERRIDE_CLOCKS = 2
+
+# sim86 register indexes of the address registers
+BX, BP, SI, DI = 2, 6, 7, 8
+
+# base + index pairs, the two slow ones take a clock longer
+PAIR_CLOCKS = {
+    frozenset((BP, DI)): 7,
+    frozenset((BX, SI)): 7,
+    frozenset((BP, SI)): 8,
+    frozenset((BX, DI)): 8,
+}
+
+@dataclass
+class InstructionClocks:
+    base: int
+    effective_address: int = 0
+    # word transfers that pay the odd address penalty, 0 for byte instructions
+    transfers: int = 0
+    # clocks when a branch falls through instead of being taken
+    not_taken: int | None = None
+
+    @property
+    def total(self) -> int:
+        return self.base + self.effective_address
+
+def effective_address_clocks(expression: sim86.EffectiveAddressExpression) -> int:
+    registers = [term.register.index for term in expression.terms if term.register.index]
+    # [bp] has no encoding without a displacement, it is always [bp + 0]
+    has_displacement = expression.displacement != 0 or registers == [BP]
+    if not registers:
+        clocks = 6
+    elif len(registers) == 1:
+        clocks = 9 if has_displacement else 5
+    else:
+        clocks = PAIR_CLOCKS.get(frozenset(registers), 8) + (4 if has_displacement else 0)
+    if expression.flags & sim86.EffectiveAddressFlag.explicit_segment:
+        clocks += SEGMENT_OVERRIDE_CLOCKS
+    return clocks
+
+def _operand_kind(operand, decoded_inst: sim86.Instruction) -> str:
+    if isinstance(operand, sim86.EffectiveAddressExpression):
+        return MEMORY
+    if isinstance(operand, sim86.Immediate):
+        return IMMEDIATE
+    if operand.index == 1 and _is_accumulator_form(decoded_inst):
+        return ACCUMULATOR
+    return REGISTER
+
+def _is_accumulator_form(decoded_inst: sim86.Instruction) -> bool:
+    # mov al/ax to or from a direct address has a 3 byte encoding of its own,
+    # the general mod reg r/m one is 4 bytes
+    size = decoded_inst.size
+    if decoded_inst.flags & sim86.InstructionFlag.segment:
+        size -= 1
+    return decoded_inst.op == Op.mov and size == 3 and any(
+        isinstance(operand, sim86.EffectiveAddressExpression) and not any(term.register.index for term in operand.terms)
+        for operand in decoded_inst.operands
+    )
+
+def instruction_clocks(decoded_inst: sim86.Instruction) -> InstructionClocks | None:
+    """
+    Clocks for one decoded instruction, None when the tables do not cover it.
+    """
+    branch = BRANCH_CLOCKS.get(decoded_inst.op)
+    if branch is not None:
+        taken, not_taken = branch
+        return InstructionClocks(taken, not_taken=not_taken)
+
+    if len(decoded_inst.operands) != 2:
+        return None
+    destination, source = decoded_inst.operands
+    key = (decoded_inst.op, _operand_kind(destination, decoded_inst), _operand_kind(source, decoded_inst))
+    timing = BASE_CLOCKS.get(key)
+    if timing is None and ACCUMULATOR in key:
+        timing = BASE_CLOCKS.get(tuple(REGISTER if kind == ACCUMULATOR else kind for kind in key))
+    if timing is None:
+        return None
+
+    base, transfers = timing
+    clocks = InstructionClocks(base)
+    for operand in decoded_inst.operands:
+        if isinstance(operand, sim86.EffectiveAddressExpression):
+            # the accumulator forms have the address built into their base clocks
+            if ACCUMULATOR not in key:
+                clocks.effective_address = effective_address_clocks(operand)
+            if decoded_inst.flags & sim86.InstructionFlag.wide:
+                clocks.transfers = transfers
+    return clocks
+
+class ClockCounter:
+    """
+    Running clock totals for a compiled program, per address and for the
+    whole run. last is what the most recent instruction cost.
+    """
+    def __init__(self):
+        self.total = 0
+        self.last = 0
+        self.instruction_count = 0
+        self.clocks_at: list[int] = []
+        self.executions_at: list[int] = []
+        self.instructions: dict[int, sim86.Instruction] = {}
+
+    def reset(self, size: int):
+        self.total = 0
+        self.last = 0
+        self.instruction_count = 0
+        self.clocks_at = [0] * size
+        self.executions_at = [0] * size
+        self.instructions = {}
+
+    def add(self, address: int, clocks: int):
+        self.last = clocks
+        self.total += clocks
+        self.instruction_count += 1
+        self.clocks_at[address] += clocks
+        self.executions_at[address] += 1
+
+    def format_summary(self) -> str:
+        lines = [' ---- Clocks ---- ', f"{'address':>7} {'count':>8} {'clocks':>10}  instruction"]
+        by_op: dict[str, list[int]] = {}
+        for address, decoded_inst in sorted(self.instructions.items()):
+            count = self.executions_at[address]
+            if not count:
+                continue
+            clocks = self.clocks_at[address]
+            lines.append(f"{address:>7x} {count:>8} {clocks:>10}  {decoded_inst}")
+            op_totals = by_op.setdefault(decoded_inst.op.name, [0, 0])
+            op_totals[0] += count
+            op_totals[1] += clocks
+        lines.append(f"{'op':>7} {'count':>8} {'clocks':>10}")
+        for name, (count, clocks) in sorted(by_op.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:>7} {count:>8} {clocks:>10}")
+        lines.append(f"total: {self.total} clocks over {self.instruction_count} instructions")
+        return '\n'.join(lines)
@@ -0,0 +1,50 @@
+# bit positions in the 8086 flags register
+CARRY = 1 << 0
+PARITY = 1 << 2
+AUXILIARY_CARRY = 1 << 4
+ZERO = 1 << 6
+SIGN = 1 << 7
+OVERFLOW = 1 << 11
+
+FLAG_NAMES = [(CARRY, 'C'), (PARITY, 'P'), (AUXILIARY_CARRY, 'A'), (ZERO, 'Z'), (SIGN, 'S'), (OVERFLOW, 'O')]
+
+# what the last flag setting instruction was, the VM keeps
+# (kind, a, b, result, wide) and only turns it into bits when asked
+FLAGS_ADD = 1
+FLAGS_SUB = 2
+
+# PARITY set when the low byte has an even number of ones
+PARITY_TABLE = [0 if bin(byte).count('1') & 1 else PARITY for byte in range(256)]
+
+def compute_flags(kind: int, a: int, b: int, result: int, wide: bool) -> int:
+    """
+    Flag bits after result = a + b or a - b, a and b being the unsigned
+    operands and result the unmasked outcome.
+    """
+    if wide:
+        mask, sign_bit = 0xFFFF, 0x8000
+    else:
+        mask, sign_bit = 0xFF, 0x80
+    value = result & mask
+
+    bits = PARITY_TABLE[value & 0xFF]
+    if value == 0:
+        bits |= ZERO
+    if value & sign_bit:
+        bits |= SIGN
+    if (a ^ b ^ result) & 0x10:
+        bits |= AUXILIARY_CARRY
+    if kind == FLAGS_ADD:
+        if result > mask:
+            bits |= CARRY
+        if (a ^ result) & (b ^ result) & sign_bit:
+            bits |= OVERFLOW
+    else:
+        if result < 0:
+            bits |= CARRY
+        if (a ^ b) & (a ^ result) & sign_bit:
+            bits |= OVERFLOW
+    return bits
+
+def format_flags(bits: int) -> str:
+    return (', ').join(name for flag, name in FLAG_NAMES if bits & flag)
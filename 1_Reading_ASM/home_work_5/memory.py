@@ -0,0 +1,83 @@
+import struct
+
+MEMORY_SIZE = 1 << 20
+MEMORY_MASK = MEMORY_SIZE - 1
+
+WORD = struct.Struct('<H')
+
+class Memory:
+    """
+    The whole 1 MB 8086 address space as one bytearray. Addresses are
+    physical and wrap at 1 MB, words are little endian and may straddle the
+    wrap.
+    """
+    __slots__ = ('data', 'view', '_unpack_word', '_pack_word', 'code_end', 'on_code_write')
+
+    def __init__(self):
+        self.data = bytearray(MEMORY_SIZE)
+        self.view = memoryview(self.data)
+        self._unpack_word = WORD.unpack_from
+        self._pack_word = WORD.pack_into
+        # stores below code_end are passed to on_code_write(address, size) so
+        # the VM can drop decoded instructions they overwrite
+        self.code_end = 0
+        self.on_code_write = None
+
+    def load8(self, address: int) -> int:
+        return self.data[address & MEMORY_MASK]
+
+    def load16(self, address: int) -> int:
+        address &= MEMORY_MASK
+        if address == MEMORY_MASK:
+            return self.data[MEMORY_MASK] | (self.data[0] << 8)
+        return self._unpack_word(self.data, address)[0]
+
+    def store8(self, address: int, value: int):
+        address &= MEMORY_MASK
+        self.data[address] = value & 0xFF
+        if address < self.code_end:
+            self.on_code_write(address, 1)
+
+    def store16(self, address: int, value: int):
+        address &= MEMORY_MASK
+        if address == MEMORY_MASK:
+            self.data[MEMORY_MASK] = value & 0xFF
+            self.data[0] = (value >> 8) & 0xFF
+            if self.code_end:
+                self.on_code_write(0, 1)
+        else:
+            self._pack_word(self.data, address, value & 0xFFFF)
+            if address < self.code_end:
+                self.on_code_write(address, 2)
+
+    def load(self, address: int, wide: bool) -> int:
+        return self.load16(address) if wide else self.load8(address)
+
+    def store(self, address: int, value: int, wide: bool):
+        if wide:
+            self.store16(address, value)
+        else:
+            self.store8(address, value)
+
+    def write_block(self, address: int, data: bytes):
+        address &= MEMORY_MASK
+        end = address + len(data)
+        if end <= MEMORY_SIZE:
+            self.view[address:end] = data
+        else:
+            split = MEMORY_SIZE - address
+            self.view[address:] = data[:split]
+            self.view[:end - MEMORY_SIZE] = data[split:]
+
+    def read_block(self, address: int, size: int) -> bytes:
+        address &= MEMORY_MASK
+        end = address + size
+        if end <= MEMORY_SIZE:
+            return bytes(self.view[address:end])
+        return bytes(self.view[address:]) + bytes(self.view[:end - MEMORY_SIZE])
+
+def physical_address(segment: int, offset: int) -> int:
+    """
+    segment:offset to a 20 bit address, the offset wraps at 64 KB inside its segment.
+    """
+    return ((segment << 4) + (offset & 0xFFFF)) & MEMORY_MASK
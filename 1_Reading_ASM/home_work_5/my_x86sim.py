@@ -1,42 +1,163 @@
+import sys
 from pathlib import Path
 from dataclasses import dataclass, field
+from typing import Callable
 
 import sim86
+from trace_sinks import TraceSink, NULL_TRACE, make_trace
+from clocks import ClockCounter, ODD_TRANSFER_PENALTY, instruction_clocks
+from memory import Memory, MEMORY_MASK, physical_address
+from registers import RegisterFile
+from flags import (
+    FLAGS_ADD, FLAGS_SUB, CARRY, PARITY, ZERO, SIGN, OVERFLOW, compute_flags, format_flags
+)
+
+# longest 8086 instruction, prefixes included
+MAX_INSTRUCTION_SIZE = 15
+
+class DecodeCache:
+    """
+    Decoded instructions keyed by the offset they start at, so a loop body is
+    only run through sim86 once. A write over any byte of a cached instruction
+    throws that entry away, the VM sends it every store that lands on code.
+
+    A miss is one instruction run through sim86. The compiled VM counts a hit
+    for every instruction it runs through an already compiled handler and a
+    recompile for every handler it has to build again after a store.
+    """
+    def __init__(self, code: bytes):
+        # patched in place by write, sim86 only ever sees one instruction's worth
+        self.code = bytearray(code)
+        self.entries: dict[int, sim86.Instruction] = {}
+        # byte offset -> offsets of the cached instructions that cover it
+        self.covering: dict[int, set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.recompiles = 0
+
+    def decode(self, offset: int) -> sim86.Instruction:
+        decoded = self.entries.get(offset)
+        if decoded is not None:
+            self.hits += 1
+            return decoded
+
+        self.misses += 1
+        window = bytes(self.code[offset:offset + MAX_INSTRUCTION_SIZE])
+        decoded = sim86.decode_8086_instruction(window, 0)
+        decoded.address = offset
+        if decoded.op != sim86.OperationType.none:
+            self._enter(offset, decoded)
+        return decoded
+
+    def add(self, offset: int, decoded: sim86.Instruction):
+        """
+        Cache an instruction decoded elsewhere, it counts as a miss.
+        """
+        self.misses += 1
+        self._enter(offset, decoded)
+
+    def _enter(self, offset: int, decoded: sim86.Instruction):
+        self.entries[offset] = decoded
+        for address in range(offset, offset + decoded.size):
+            self.covering.setdefault(address, set()).add(offset)
+
+    def invalidate(self, address: int, size: int = 1) -> list[int]:
+        """
+        Drop every entry covering address..address + size, returns their offsets.
+        """
+        dropped = []
+        for byte_address in range(address, address + size):
+            for start in self.covering.pop(byte_address, ()):
+                decoded = self.entries.pop(start, None)
+                if decoded is None:
+                    continue
+                self.invalidations += 1
+                dropped.append(start)
+                for covered in range(start, start + decoded.size):
+                    starts = self.covering.get(covered)
+                    if starts is not None:
+                        starts.discard(start)
+        return dropped
+
+    def write(self, address: int, data: bytes) -> list[int]:
+        self.code[address:address + len(data)] = data
+        return self.invalidate(address, len(data))
+
+    def stats(self) -> str:
+        return (f"decode cache: {self.hits} hits, {self.misses} misses, "
+                f"{self.invalidations} invalidations, {self.recompiles} recompiles")
+
+# a compiled instruction runs itself against the machine and returns the
+# address of the next one
+Handler = Callable[[], int]
+
+# why run_compiled returned, left in VirtualMachine.stop_reason
+STOPPED_LEFT_CODE = 1
+STOPPED_BUDGET = 2
+STOPPED_UNDECODED = 3
+
+# sim86 register indexes the VM needs by name
+REGISTER_C = 3
+REGISTER_BP = 6
+SEGMENT_SS = 11
+SEGMENT_DS = 12
 
 class VirtualMachine:
-    def __init__(self):
-        self.registers = [0 for x in range(12)] 
-        self.verbose: bool = True
-        self.zero_flag = False
-        self.signed_flag = False
-
-    def get_flags(self):
-        flags = []
-        if self.zero_flag:
-            flags.append('Z')
-        if self.signed_flag:
-            flags.append('S')
-        return (', ').join(flags)
-
-    def print_registers(self):
-        print(' ---- Final Registers ---- ')
-        for i, register in enumerate(self.registers):
+    def __init__(self, trace: TraceSink = NULL_TRACE, clocks: ClockCounter | None = None):
+        self.registers = RegisterFile()
+        self.memory = Memory()
+        # NULL_TRACE means no per instruction work at all beyond executing it
+        self.trace = trace
+        self.ip = 0
+        # set up by compile_program, the code also lives in memory from address 0
+        self.decode_cache: DecodeCache | None = None
+        self.handlers: list[Handler | None] = []
+        self.stop_reason: int | None = None
+        # with a ClockCounter every compiled instruction also adds up its 8086 clocks
+        self.clocks = clocks
+        # add/sub/cmp only leave (kind, a, b, result, wide) here, the flag bits
+        # are worked out from it when something reads them
+        self.lazy_flags: tuple | None = None
+        self.flag_bits = 0
+
+    def get_flag_bits(self) -> int:
+        # where the 8086 keeps them in the flags register
+        lazy_flags = self.lazy_flags
+        if lazy_flags is not None:
+            self.flag_bits = compute_flags(*lazy_flags)
+            self.lazy_flags = None
+        return self.flag_bits
+
+    def get_flags(self) -> str:
+        return format_flags(self.get_flag_bits())
+
+    @property
+    def zero_flag(self) -> bool:
+        return bool(self.get_flag_bits() & ZERO)
+
+    @property
+    def signed_flag(self) -> bool:
+        return bool(self.get_flag_bits() & SIGN)
+
+    def format_registers(self) -> str:
+        lines = [' ---- Final Registers ---- ']
+        for i, register in enumerate(self.registers.values()):
             if i == 8:
                 break
-            print(f"{sim86.registers_dict[i+1]}: {hex(register)} ({register})")
-        print(self.get_flags())
+            lines.append(f"{sim86.registers_dict[i+1]}: {hex(register)} ({register})")
+        lines.append(self.get_flags())
+        return '\n'.join(lines)
 
-    def flag_check(self, value):
-        print(value)
-        self.signed_flag = value < 0
-        self.zero_flag = value == 0
+    def print_registers(self):
+        print(self.format_registers())
 
-    def exec_instruction(
-            self, 
-            decoded_inst: sim86.Instruction, 
-            formatted_bytes: str
-            ) -> None:
+    def exec_instruction(self, decoded_inst: sim86.Instruction) -> None:
+        self._execute(decoded_inst)
+        if self.trace is not NULL_TRACE:
+            self.trace.record(self, decoded_inst)
 
+    def _execute(self, decoded_inst: sim86.Instruction):
         if decoded_inst.op.name == 'mov':
             self.mov(decoded_inst)
 
@@ -49,114 +170,598 @@ class VirtualMachine:
         if decoded_inst.op.name == 'add':
             self.add(decoded_inst)
 
-        print(f"{decoded_inst} flags: {self.get_flags()}")
+    def compile_instruction(self, decoded_inst: sim86.Instruction) -> Handler:
+        """
+        Specialise one decoded instruction into a closure with its register
+        indexes, immediate and address terms already bound, so running it does
+        no op name compares or isinstance checks.
+        """
+        next_address = decoded_inst.address + decoded_inst.size
+        operands = decoded_inst.operands
+        op = decoded_inst.op
+        if op in BRANCH_COMPILERS:
+            handler = self.compile_branch(decoded_inst, next_address)
+            if handler is None:
+                return self._compile_fallback(decoded_inst, next_address)
+            handler.instruction = decoded_inst
+            return handler
+        if len(operands) != 2:
+            return self._compile_fallback(decoded_inst, next_address)
+
+        destination, source = operands
+        handler = None
+        wide = instruction_wide(decoded_inst)
+        if (isinstance(destination, sim86.RegisterAccess) and destination.count == 2
+                and (isinstance(source, sim86.Immediate) or getattr(source, 'count', 0) == 2)):
+            # word register to register and immediate to register get their own handlers
+            if isinstance(source, sim86.Immediate):
+                compile_op = IMMEDIATE_COMPILERS.get(op)
+                source_value = source.value & 0xFFFF
+            else:
+                compile_op = REGISTER_COMPILERS.get(op)
+                source_value = source.index - 1
+            if compile_op is not None:
+                handler = compile_op(self, destination.index - 1, source_value, next_address)
+        else:
+            compile_op = OPERAND_COMPILERS.get(op)
+            if compile_op is not None:
+                handler = compile_op(
+                    self,
+                    self.compile_reader(destination, wide),
+                    self.compile_writer(destination, wide),
+                    self.compile_reader(source, wide),
+                    wide,
+                    next_address,
+                )
+
+        if handler is None:
+            return self._compile_fallback(decoded_inst, next_address)
+        handler.instruction = decoded_inst
+        return handler
+
+    def compile_branch(self, decoded_inst: sim86.Instruction, next_address: int) -> Handler | None:
+        """
+        Jumps, loops and jcxz. The target is worked out here, so taking the
+        branch is just returning it.
+        """
+        operands = decoded_inst.operands
+        if len(operands) != 1 or not isinstance(operands[0], sim86.Immediate):
+            return None
+        if not operands[0].flags & sim86.ImmediateFlag.relative_jump_displacement:
+            return None
+        target = (next_address + operands[0].value) & 0xFFFF
+        return BRANCH_COMPILERS[decoded_inst.op](self, target, next_address)
+
+    def compile_address(self, expression: sim86.EffectiveAddressExpression) -> Callable[[], int]:
+        registers = self.registers.words
+        displacement = expression.displacement
+        segment = self.segment_index(expression) - 1
+        indexes = [term.register.index - 1 for term in expression.terms if term.register.index]
+        if not indexes:
+            def address():
+                return ((registers[segment] << 4) + (displacement & 0xFFFF)) & MEMORY_MASK
+        elif len(indexes) == 1:
+            first = indexes[0]
+            def address():
+                return ((registers[segment] << 4) + ((registers[first] + displacement) & 0xFFFF)) & MEMORY_MASK
+        else:
+            first, second = indexes
+            def address():
+                return ((registers[segment] << 4) + ((registers[first] + registers[second] + displacement) & 0xFFFF)) & MEMORY_MASK
+        return address
+
+    def compile_reader(self, operand, wide: bool) -> Callable[[], int]:
+        if isinstance(operand, sim86.EffectiveAddressExpression):
+            address = self.compile_address(operand)
+            load = self.memory.load16 if wide else self.memory.load8
+            def read():
+                return load(address())
+        elif isinstance(operand, sim86.RegisterAccess):
+            return self.registers.readers[operand.index, operand.offset, operand.count]
+        else:
+            value = operand.value
+            def read():
+                return value
+        return read
+
+    def compile_writer(self, operand, wide: bool) -> Callable[[int], None] | None:
+        if isinstance(operand, sim86.EffectiveAddressExpression):
+            address = self.compile_address(operand)
+            store = self.memory.store16 if wide else self.memory.store8
+            def write(value):
+                store(address(), value)
+        elif isinstance(operand, sim86.RegisterAccess):
+            return self.registers.writers[operand.index, operand.offset, operand.count]
+        else:
+            return None
+        return write
+
+    def _compile_fallback(self, decoded_inst: sim86.Instruction, next_address: int) -> Handler:
+        execute = self._execute
+        def handler():
+            execute(decoded_inst)
+            return next_address
+        handler.instruction = decoded_inst
+        return handler
+
+    def compile_program(self, code: bytes) -> list[Handler | None]:
+        """
+        Load code into memory at address 0 and compile every instruction in it
+        up front. The list is indexed by address, slots that are not the start
+        of an instruction hold None. A store over code drops the handlers it
+        touches, they are decoded and compiled again when they next run.
+        """
+        handlers: list[Handler | None] = [None] * len(code)
+        self.handlers = handlers
+        self.memory.write_block(0, code)
+        self.memory.code_end = len(code)
+        self.memory.on_code_write = self._code_written
+        self.decode_cache = DecodeCache(code)
+        if self.clocks is not None:
+            self.clocks.reset(len(code))
+        block = sim86.decode_8086_block(code)
+        for offset, decoded in zip(block.offsets, block):
+            self.decode_cache.add(offset, decoded)
+            handlers[offset] = self._compile_with_clocks(decoded)
+        return handlers
+
+    def _compile_with_clocks(self, decoded: sim86.Instruction) -> Handler:
+        handler = self.compile_instruction(decoded)
+        if self.clocks is not None:
+            handler = self.compile_clocks(handler, decoded)
+        return handler
+
+    def compile_at(self, address: int) -> Handler | None:
+        """
+        Decode and compile the instruction at address into self.handlers, None
+        when the bytes there do not decode.
+        """
+        if self.decode_cache is None:
+            return None
+        decoded = self.decode_cache.decode(address)
+        if decoded.op == sim86.OperationType.none:
+            return None
+        self.decode_cache.recompiles += 1
+        handler = self.handlers[address] = self._compile_with_clocks(decoded)
+        return handler
+
+    def _code_written(self, address: int, size: int):
+        data = self.memory.read_block(address, size)
+        for start in self.decode_cache.write(address, data):
+            self.handlers[start] = None
+
+    def compile_clocks(self, handler: Handler, decoded_inst: sim86.Instruction) -> Handler:
+        """
+        Wrap a compiled handler so it adds its clocks to self.clocks. Only the
+        odd address penalty and whether a branch was taken are left to work
+        out while running.
+        """
+        counter = self.clocks
+        counter.instructions[decoded_inst.address] = decoded_inst
+        address = decoded_inst.address
+        add = counter.add
+        estimate = instruction_clocks(decoded_inst)
+        inner = handler
+
+        if estimate is None:
+            def handler():
+                ip = inner()
+                add(address, 0)
+                return ip
+        elif estimate.not_taken is not None:
+            taken = estimate.total
+            not_taken = estimate.not_taken
+            fall_through = decoded_inst.address + decoded_inst.size
+            def handler():
+                ip = inner()
+                add(address, not_taken if ip == fall_through else taken)
+                return ip
+        elif estimate.transfers:
+            clocks = estimate.total
+            penalty = estimate.transfers * ODD_TRANSFER_PENALTY
+            memory_operand = next(
+                operand for operand in decoded_inst.operands
+                if isinstance(operand, sim86.EffectiveAddressExpression)
+            )
+            # worked out before the instruction runs, it may change the registers the address uses
+            memory_address = self.compile_address(memory_operand)
+            def handler():
+                odd = memory_address() & 1
+                ip = inner()
+                add(address, clocks + penalty if odd else clocks)
+                return ip
+        else:
+            clocks = estimate.total
+            def handler():
+                ip = inner()
+                add(address, clocks)
+                return ip
+
+        handler.instruction = decoded_inst
+        return handler
+
+    def run_compiled(self, handlers: list[Handler | None], max_steps: int | None = None) -> int:
+        """
+        Run compiled handlers from self.ip until ip leaves the code, lands on
+        bytes that did not decode or max_steps instructions have run. self.ip
+        is left on where it stopped, so a run that used up its budget can be
+        picked up again, and self.stop_reason on which of the three it was.
+        Returns the number of instructions executed.
+        """
+        end = len(handlers)
+        budget = sys.maxsize if max_steps is None else max_steps
+        ip = self.ip
+        count = 0
+        compiled = 0
+        trace = self.trace
+        if trace is NULL_TRACE:
+            while ip < end and count < budget:
+                handler = handlers[ip]
+                if handler is None:
+                    handler = self.compile_at(ip)
+                    if handler is None:
+                        break
+                    compiled += 1
+                ip = handler()
+                count += 1
+        else:
+            record = trace.record
+            while ip < end and count < budget:
+                handler = handlers[ip]
+                if handler is None:
+                    handler = self.compile_at(ip)
+                    if handler is None:
+                        break
+                    compiled += 1
+                ip = handler()
+                record(self, handler.instruction)
+                count += 1
+        self.ip = ip
+        if ip >= end:
+            self.stop_reason = STOPPED_LEFT_CODE
+        elif count >= budget:
+            self.stop_reason = STOPPED_BUDGET
+        else:
+            self.stop_reason = STOPPED_UNDECODED
+        if self.decode_cache is not None:
+            # every other instruction ran on a handler compiled earlier
+            self.decode_cache.hits += count - compiled
+        return count
+
+    def segment_index(self, expression: sim86.EffectiveAddressExpression) -> int:
+        if expression.flags & sim86.EffectiveAddressFlag.explicit_segment:
+            return expression.explicit_segment
+        for term in expression.terms:
+            if term.register.index == REGISTER_BP:
+                return SEGMENT_SS
+        return SEGMENT_DS
+
+    def effective_address(self, expression: sim86.EffectiveAddressExpression) -> int:
+        registers = self.registers.words
+        offset = expression.displacement
+        for term in expression.terms:
+            if term.register.index:
+                offset += registers[term.register.index - 1]
+        return physical_address(registers[self.segment_index(expression) - 1], offset)
+
+    def read_operand(self, operand, wide: bool) -> int:
+        if isinstance(operand, sim86.RegisterAccess):
+            return self.registers.read(operand)
+        if isinstance(operand, sim86.EffectiveAddressExpression):
+            return self.memory.load(self.effective_address(operand), wide)
+        return operand.value
+
+    def write_operand(self, operand, value: int, wide: bool):
+        if isinstance(operand, sim86.EffectiveAddressExpression):
+            self.memory.store(self.effective_address(operand), value, wide)
+        else:
+            self.registers.write(operand, value)
 
     def add(self, decoded_inst: sim86.Instruction):
-        destination  = decoded_inst.operands[0]
-        source  = decoded_inst.operands[1]
-        dest_index = destination.index - 1
-
-        if isinstance(source, sim86.RegisterAccess):
-            source_value = self.registers[source.index -1]
-
-        elif isinstance(source, sim86.EffectiveAddressExpression):
-            source_value = self.registers[source.explicit_segment + source.displacement]
-
-        elif isinstance(source, sim86.Immediate):
-            source_value = source.value
-
-        self.registers[dest_index] += source_value
-        self.flag_check(self.registers[dest_index])
+        destination, source = decoded_inst.operands
+        wide = instruction_wide(decoded_inst)
+        mask = 0xFFFF if wide else 0xFF
+        a = self.read_operand(destination, wide) & mask
+        b = self.read_operand(source, wide) & mask
+        result = a + b
+        self.write_operand(destination, result, wide)
+        self.lazy_flags = (FLAGS_ADD, a, b, result, wide)
 
     def sub(self, decoded_inst: sim86.Instruction):
-        destination  = decoded_inst.operands[0]
-        source  = decoded_inst.operands[1]
-        dest_index = destination.index - 1
-
-        if isinstance(source, sim86.RegisterAccess):
-            source_value = self.registers[source.index -1]
-
-        elif isinstance(source, sim86.EffectiveAddressExpression):
-            source_value = self.registers[source.explicit_segment + source.displacement]
-
-        elif isinstance(source, sim86.Immediate):
-            source_value = source.value
-
-        self.registers[dest_index] -= source_value
-        breakpoint()
-        self.flag_check(self.registers[dest_index])
+        destination, source = decoded_inst.operands
+        wide = instruction_wide(decoded_inst)
+        mask = 0xFFFF if wide else 0xFF
+        a = self.read_operand(destination, wide) & mask
+        b = self.read_operand(source, wide) & mask
+        result = a - b
+        self.write_operand(destination, result, wide)
+        self.lazy_flags = (FLAGS_SUB, a, b, result, wide)
 
     def cmp(self, decoded_inst: sim86.Instruction):
-        destination  = decoded_inst.operands[0]
-        source  = decoded_inst.operands[1]
-        dest_index = destination.index - 1
-
-        if isinstance(source, sim86.RegisterAccess):
-            source_value = self.registers[source.index -1]
-
-        elif isinstance(source, sim86.EffectiveAddressExpression):
-            source_value = self.registers[source.explicit_segment + source.displacement]
-
-        elif isinstance(source, sim86.Immediate):
-            source_value = source.value
-        result = self.registers[dest_index] - source_value
-        # breakpoint()
-        self.flag_check(result)
-
+        destination, source = decoded_inst.operands
+        wide = instruction_wide(decoded_inst)
+        mask = 0xFFFF if wide else 0xFF
+        a = self.read_operand(destination, wide) & mask
+        b = self.read_operand(source, wide) & mask
+        result = a - b
+        self.lazy_flags = (FLAGS_SUB, a, b, result, wide)
 
     def mov(self, decoded_inst: sim86.Instruction):
-        destination  = decoded_inst.operands[0]
-        source  = decoded_inst.operands[1]
-
-        # destination is always a reg, source may not always be a reg
-
-        dest_index = destination.index - 1
-
-        if isinstance(source, sim86.RegisterAccess):
-            source_value = self.registers[source.index -1]
-
-        elif isinstance(source, sim86.EffectiveAddressExpression):
-            source_value = self.registers[source.explicit_segment + source.displacement]
-
-        elif isinstance(source, sim86.Immediate):
-            source_value = source.value
-
-        self.registers[dest_index] = source_value
-
-        # self.registers['ah'] = decoded_inst.operands[1].value
-        # print(self.registers.registers)
-
+        destination, source = decoded_inst.operands
+        wide = instruction_wide(decoded_inst)
+        self.write_operand(destination, self.read_operand(source, wide), wide)
+
+def instruction_wide(decoded_inst: sim86.Instruction) -> bool:
+    # a register destination knows its own width, segment registers included
+    destination = decoded_inst.operands[0]
+    if isinstance(destination, sim86.RegisterAccess):
+        return destination.count == 2
+    return bool(decoded_inst.flags & sim86.InstructionFlag.wide)
+
+# op -> factory for the compiled handler of a word register destination, split
+# by source operand kind. Each factory takes (vm, dest_index, source,
+# next_address), source being a register index or an immediate value.
+
+def _mov_register(vm: VirtualMachine, dest_index: int, source_index: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        words[dest_index] = words[source_index]
+        return next_address
+    return handler
+
+def _mov_immediate(vm: VirtualMachine, dest_index: int, value: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        words[dest_index] = value
+        return next_address
+    return handler
+
+def _add_register(vm: VirtualMachine, dest_index: int, source_index: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        a = words[dest_index]
+        b = words[source_index]
+        result = a + b
+        words[dest_index] = result & 0xFFFF
+        vm.lazy_flags = (FLAGS_ADD, a, b, result, True)
+        return next_address
+    return handler
+
+def _add_immediate(vm: VirtualMachine, dest_index: int, value: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        a = words[dest_index]
+        result = a + value
+        words[dest_index] = result & 0xFFFF
+        vm.lazy_flags = (FLAGS_ADD, a, value, result, True)
+        return next_address
+    return handler
+
+def _sub_register(vm: VirtualMachine, dest_index: int, source_index: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        a = words[dest_index]
+        b = words[source_index]
+        result = a - b
+        words[dest_index] = result & 0xFFFF
+        vm.lazy_flags = (FLAGS_SUB, a, b, result, True)
+        return next_address
+    return handler
+
+def _sub_immediate(vm: VirtualMachine, dest_index: int, value: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        a = words[dest_index]
+        result = a - value
+        words[dest_index] = result & 0xFFFF
+        vm.lazy_flags = (FLAGS_SUB, a, value, result, True)
+        return next_address
+    return handler
+
+def _cmp_register(vm: VirtualMachine, dest_index: int, source_index: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        a = words[dest_index]
+        b = words[source_index]
+        vm.lazy_flags = (FLAGS_SUB, a, b, a - b, True)
+        return next_address
+    return handler
+
+def _cmp_immediate(vm: VirtualMachine, dest_index: int, value: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    def handler():
+        a = words[dest_index]
+        vm.lazy_flags = (FLAGS_SUB, a, value, a - value, True)
+        return next_address
+    return handler
+
+# memory and byte register operands go through reader and writer closures
+# instead, the factory takes (vm, read_destination, write_destination,
+# read_source, wide, next_address)
+
+def _mov_operands(vm: VirtualMachine, read_destination, write_destination, read_source, wide: bool, next_address: int) -> Handler:
+    def handler():
+        write_destination(read_source())
+        return next_address
+    return handler
+
+def _add_operands(vm: VirtualMachine, read_destination, write_destination, read_source, wide: bool, next_address: int) -> Handler:
+    mask = 0xFFFF if wide else 0xFF
+    def handler():
+        a = read_destination()
+        b = read_source() & mask
+        result = a + b
+        write_destination(result)
+        vm.lazy_flags = (FLAGS_ADD, a, b, result, wide)
+        return next_address
+    return handler
+
+def _sub_operands(vm: VirtualMachine, read_destination, write_destination, read_source, wide: bool, next_address: int) -> Handler:
+    mask = 0xFFFF if wide else 0xFF
+    def handler():
+        a = read_destination()
+        b = read_source() & mask
+        result = a - b
+        write_destination(result)
+        vm.lazy_flags = (FLAGS_SUB, a, b, result, wide)
+        return next_address
+    return handler
+
+def _cmp_operands(vm: VirtualMachine, read_destination, write_destination, read_source, wide: bool, next_address: int) -> Handler:
+    mask = 0xFFFF if wide else 0xFF
+    def handler():
+        a = read_destination()
+        b = read_source() & mask
+        result = a - b
+        vm.lazy_flags = (FLAGS_SUB, a, b, result, wide)
+        return next_address
+    return handler
+
+# branches, the factory takes (vm, target, next_address)
+
+def _conditional_jump(condition: Callable[[int], bool]):
+    def compile_jump(vm: VirtualMachine, target: int, next_address: int) -> Handler:
+        get_flag_bits = vm.get_flag_bits
+        def handler():
+            if condition(get_flag_bits()):
+                return target
+            return next_address
+        return handler
+    return compile_jump
+
+def _jmp(vm: VirtualMachine, target: int, next_address: int) -> Handler:
+    def handler():
+        return target
+    return handler
+
+def _loop(vm: VirtualMachine, target: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    cx = REGISTER_C - 1
+    def handler():
+        count = words[cx] = (words[cx] - 1) & 0xFFFF
+        if count:
+            return target
+        return next_address
+    return handler
+
+def _loopz(vm: VirtualMachine, target: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    cx = REGISTER_C - 1
+    get_flag_bits = vm.get_flag_bits
+    def handler():
+        count = words[cx] = (words[cx] - 1) & 0xFFFF
+        if count and get_flag_bits() & ZERO:
+            return target
+        return next_address
+    return handler
+
+def _loopnz(vm: VirtualMachine, target: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    cx = REGISTER_C - 1
+    get_flag_bits = vm.get_flag_bits
+    def handler():
+        count = words[cx] = (words[cx] - 1) & 0xFFFF
+        if count and not get_flag_bits() & ZERO:
+            return target
+        return next_address
+    return handler
+
+def _jcxz(vm: VirtualMachine, target: int, next_address: int) -> Handler:
+    words = vm.registers.words
+    cx = REGISTER_C - 1
+    def handler():
+        if words[cx]:
+            return next_address
+        return target
+    return handler
+
+def _sign_differs(bits: int) -> bool:
+    return bool(bits & SIGN) != bool(bits & OVERFLOW)
+
+BRANCH_COMPILERS = {
+    sim86.OperationType.jmp: _jmp,
+    sim86.OperationType.je: _conditional_jump(lambda bits: bits & ZERO),
+    sim86.OperationType.jne: _conditional_jump(lambda bits: not bits & ZERO),
+    sim86.OperationType.jl: _conditional_jump(_sign_differs),
+    sim86.OperationType.jnl: _conditional_jump(lambda bits: not _sign_differs(bits)),
+    sim86.OperationType.jle: _conditional_jump(lambda bits: bits & ZERO or _sign_differs(bits)),
+    sim86.OperationType.jg: _conditional_jump(lambda bits: not bits & ZERO and not _sign_differs(bits)),
+    sim86.OperationType.jb: _conditional_jump(lambda bits: bits & CARRY),
+    sim86.OperationType.jnb: _conditional_jump(lambda bits: not bits & CARRY),
+    sim86.OperationType.jbe: _conditional_jump(lambda bits: bits & (CARRY | ZERO)),
+    sim86.OperationType.ja: _conditional_jump(lambda bits: not bits & (CARRY | ZERO)),
+    sim86.OperationType.jp: _conditional_jump(lambda bits: bits & PARITY),
+    sim86.OperationType.jnp: _conditional_jump(lambda bits: not bits & PARITY),
+    sim86.OperationType.jo: _conditional_jump(lambda bits: bits & OVERFLOW),
+    sim86.OperationType.jno: _conditional_jump(lambda bits: not bits & OVERFLOW),
+    sim86.OperationType.js: _conditional_jump(lambda bits: bits & SIGN),
+    sim86.OperationType.jns: _conditional_jump(lambda bits: not bits & SIGN),
+    sim86.OperationType.loop: _loop,
+    sim86.OperationType.loopz: _loopz,
+    sim86.OperationType.loopnz: _loopnz,
+    sim86.OperationType.jcxz: _jcxz,
+}
+
+REGISTER_COMPILERS = {
+    sim86.OperationType.mov: _mov_register,
+    sim86.OperationType.add: _add_register,
+    sim86.OperationType.sub: _sub_register,
+    sim86.OperationType.cmp: _cmp_register,
+}
+
+IMMEDIATE_COMPILERS = {
+    sim86.OperationType.mov: _mov_immediate,
+    sim86.OperationType.add: _add_immediate,
+    sim86.OperationType.sub: _sub_immediate,
+    sim86.OperationType.cmp: _cmp_immediate,
+}
+
+OPERAND_COMPILERS = {
+    sim86.OperationType.mov: _mov_operands,
+    sim86.OperationType.add: _add_operands,
+    sim86.OperationType.sub: _sub_operands,
+    sim86.OperationType.cmp: _cmp_operands,
+}
 
 if __name__ == "__main__":
+    # python my_x86sim.py [listing] [none | text | ring:<size> | file:<path>] [max steps] [--clocks]
     # bin_path_as_str = Path("listing_0045_challenge_register_movs") 
-    bin_path_as_str = Path("listing_0046_add_sub_cmp") 
+    show_clocks = '--clocks' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--clocks']
+    bin_path_as_str = Path(args[0] if len(args) > 0 else "listing_0046_add_sub_cmp")
     # bin_path_as_str = Path("listing_0043_immediate_movs") 
 
     # bin_path_as_str = Path("listing_0040_challenge_movs")
-    vm = VirtualMachine()
+    trace = make_trace(args[1] if len(args) > 1 else 'text')
+    max_steps = int(args[2]) if len(args) > 2 else None
+    vm = VirtualMachine(trace, ClockCounter() if show_clocks else None)
     try:
         with Path(bin_path_as_str).open('rb') as f:
             bin = f.read()
-            offset = 0
-
-            while offset < len(bin):
-                decoded = sim86.decode_8086_instruction(bin, offset)
-                if decoded.op != sim86.OperationType.none:
-                    last_offset = offset
-                    offset += decoded.size
-                    
-                    literal_bytes = bin[last_offset:offset]
-                    literal_bytes_as_binary_str = ' '.join(format(byte, '08b') for byte in literal_bytes)
-                    formatted_bytes = (literal_bytes_as_binary_str)
-
-                    op = sim86.mnemonic_from_operation_type(decoded.op)
-                    dst, src  = decoded.operands
-                    vm.exec_instruction(decoded, formatted_bytes)
-
-                else:
-                    print("unrecognized instruction")
-                    break
-            vm.print_registers()
-
     except FileNotFoundError:
-            print(f"Error: File not found at {bin_path_as_str}")
\ No newline at end of file
+            print(f"Error: File not found at {bin_path_as_str}")
+            sys.exit(1)
+
+    handlers = vm.compile_program(bin)
+    try:
+        count = vm.run_compiled(handlers, max_steps)
+    except Exception:
+        # whatever the sink kept is the post-mortem
+        for line in trace.dump():
+            print(line)
+        raise
+    finally:
+        trace.close()
+
+    if vm.stop_reason == STOPPED_UNDECODED:
+        print("unrecognized instruction")
+    elif vm.stop_reason == STOPPED_BUDGET:
+        print(f"stopped after {count} instructions, the step budget ran out")
+    for line in trace.dump():
+        print(line)
+    vm.print_registers()
+    print(f"ip: {hex(vm.ip)} ({vm.ip})")
+    print(f"{count} instructions")
+    print(vm.decode_cache.stats())
+    if vm.clocks is not None:
+        print(vm.clocks.format_summary())
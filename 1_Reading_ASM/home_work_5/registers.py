@@ -0,0 +1,57 @@
+from typing import Callable
+
+# ax bx cx dx sp bp si di es cs ss ds, in sim86 index order starting at 1
+REGISTER_COUNT = 12
+
+class RegisterFile:
+    """
+    The registers as a list of 16 bit words, ax is words[0]. Every write is
+    masked to 16 bits by whoever makes it, so the compiled handlers can index
+    the list directly. al and ah are the low and high byte of their word,
+    a byte write masks and shifts it into place.
+
+    Accessors for every sim86 (index, offset, count) are built once, reading
+    or writing al, ah or ax is then one call and one index.
+    """
+    def __init__(self):
+        # a plain list, indexing a memoryview cast to 'H' made the compiled
+        # handlers 20 to 50% slower
+        self.words = [0] * REGISTER_COUNT
+        self.readers: dict[tuple[int, int, int], Callable[[], int]] = {}
+        self.writers: dict[tuple[int, int, int], Callable[[int], None]] = {}
+        for index in range(1, REGISTER_COUNT + 1):
+            self._add_accessors(index)
+
+    def _add_accessors(self, index: int):
+        words = self.words
+        word = index - 1
+
+        def read_word():
+            return words[word]
+        def write_word(value):
+            words[word] = value & 0xFFFF
+        self.readers[index, 0, 2] = read_word
+        self.writers[index, 0, 2] = write_word
+
+        def read_low():
+            return words[word] & 0xFF
+        def write_low(value):
+            words[word] = (words[word] & 0xFF00) | (value & 0xFF)
+        self.readers[index, 0, 1] = read_low
+        self.writers[index, 0, 1] = write_low
+
+        def read_high():
+            return words[word] >> 8
+        def write_high(value):
+            words[word] = (words[word] & 0x00FF) | ((value & 0xFF) << 8)
+        self.readers[index, 1, 1] = read_high
+        self.writers[index, 1, 1] = write_high
+
+    def read(self, access) -> int:
+        return self.readers[access.index, access.offset, access.count]()
+
+    def write(self, access, value: int):
+        self.writers[access.index, access.offset, access.count](value)
+
+    def values(self) -> list[int]:
+        return list(self.words)
@@ -3,121 +3,29 @@
 import ctypes
 import pathlib
 import typing
-from enum import IntEnum, IntFlag, EnumType
-from dataclasses import dataclass, fields
+from enum import IntEnum, EnumType
+from dataclasses import fields
 
 ### public interface
 
-VERSION = 3
-
-OperationType = IntEnum("OperationType", """
-  none mov push pop xchg in out xlat lea lds les lahf sahf
-  pushf popf add adc inc aaa daa sub sbb dec neg cmp aas
-  das mul imul aam div idiv aad cbw cwd not shl shr sar rol
-  ror rcl rcr and test or xor rep movs cmps scas lods stos
-  call jmp ret retf je jl jle jb jbe jp jo js jne jnl jg jnb
-  ja jnp jno jns loop loopz loopnz jcxz int int3 into iret
-  clc cmc stc cld std cli sti hlt wait esc lock segment
-""".split(), start=0)
- 
-InstructionFlag = IntFlag("InstructionFlag", """
-  lock rep segment wide far
-""".split())
-
-EffectiveAddressFlag = IntFlag("EffectiveAddressFlag", """
-  explicit_segment
-""".split())
-
-ImmediateFlag = IntFlag("ImmediateFlag", """
-  relative_jump_displacement
-""".split())
-
-InstructionBitsUsage = IntEnum("InstructionBitsUsage", """
-  end literal d s w v z mod reg rm sr disp data
-  disp_always_w w_makes_data_w rm_reg_always_w
-  rel_jump_disp far
-""".split(), start=0)
-
-registers_dict = {
-  1: 'ax',
-  2: 'bx',
-  3: 'cx',
-  4: 'dx',
-  5: 'sp',
-  6: 'bp',
-  7: 'si',
-  8: 'di',
-  8: 'di',
-  9: 'es',
-  11: 'ss',
-  12: 'ds'
-}
-
-@dataclass
-class RegisterAccess:
-  index: int
-  offset: int
-  count: int
-
-  def __str__(self):
-    if self.offset:
-      return f"{registers_dict[self.index][0]}l"
-    return f"{registers_dict[self.index]}"
-
-@dataclass
-class EffectiveAddressTerm:
-  register: RegisterAccess
-  scale: int
-
-@dataclass
-class EffectiveAddressExpression:
-  terms: list[EffectiveAddressTerm]
-  explicit_segment: int
-  displacement: int
-  flags: EffectiveAddressFlag
-
-@dataclass
-class Immediate:
-  value: int
-  flags: ImmediateFlag
-
-  def __str__(self):
-    return str(self.value)
-    
-@dataclass
-class Instruction:
-  address: int
-  size: int
-  op: OperationType
-  flags: InstructionFlag
-  operands: list[typing.Union[EffectiveAddressExpression, RegisterAccess, Immediate]]
-  segment_override: int
-
-  def __str__(self):
-    operands = [str(operand) for operand in self.operands]
-    return f"{self.op.name} {(', ').join(operands)}"
-
-@dataclass
-class InstructionBits:
-  usage: InstructionBitsUsage
-  bit_count: int
-  shift: int
-  value: int
-
-  @staticmethod
-  def _convert(arg):
-    return 
-
-@dataclass
-class InstructionEncoding:
-  op: OperationType
-  bits: list[InstructionBits]
-
-@dataclass
-class InstructionTable:
-  encodings: list[InstructionEncoding]
-  max_instruction_byte_count: int
-
+from sim86_types import (
+  VERSION,
+  OperationType,
+  InstructionFlag,
+  EffectiveAddressFlag,
+  ImmediateFlag,
+  InstructionBitsUsage,
+  registers_dict,
+  RegisterAccess,
+  EffectiveAddressTerm,
+  EffectiveAddressExpression,
+  Immediate,
+  Instruction,
+  InstructionBits,
+  InstructionEncoding,
+  InstructionTable,
+  DecodedBlock,
+)
 
 def get_version() -> int:
   return _get_version()
@@ -130,8 +38,38 @@ def decode_8086_instruction(data: bytes, offset: int) -> Instruction:
   ptr = ctypes.cast(data, ctypes.POINTER(ctypes.c_ubyte))
   ptr = ctypes.addressof(ptr.contents) + offset
   _decode_8086_instruction(length, ptr, ctypes.byref(decoded))
+  # the DLL fills in the pointer it was handed, the callers want the offset
+  decoded.address = offset
   return _make(decoded)
 
+# instructions per raw struct array in decode_8086_block
+BLOCK_CHUNK = 256
+
+def decode_8086_block(data: bytes, start: int = 0, end: int | None = None) -> DecodedBlock:
+  assert isinstance(data, bytes)
+  if end is None:
+    end = len(data)
+  base = ctypes.addressof(ctypes.cast(data, ctypes.POINTER(ctypes.c_ubyte)).contents)
+  decode = _decode_8086_instruction
+
+  # raw structs are allocated BLOCK_CHUNK at a time as the decode gets to them,
+  # sizing for one per input byte would waste most of a struct per byte
+  chunks = []
+  offsets = []
+  offset = start
+  while offset < end:
+    slot = len(offsets) % BLOCK_CHUNK
+    if slot == 0:
+      chunks.append((_instruction * BLOCK_CHUNK)())
+    decoded = chunks[-1][slot]
+    decode(end - offset, base + offset, ctypes.byref(decoded))
+    if decoded.op == OperationType.none:
+      break
+    decoded.address = offset
+    offsets.append(offset)
+    offset += decoded.size
+  return DecodedBlock(offsets, offset, lambda i: _make(chunks[i // BLOCK_CHUNK][i % BLOCK_CHUNK]))
+
 def register_name_from_operand(register_access: RegisterAccess) -> str:
   access = _register_access(register_access.index, register_access.offset, register_access.count)
   return _register_name_from_operand(ctypes.byref(access)).decode("ascii")
@@ -226,41 +164,83 @@ class _instruction_table(ctypes.Structure):
   def _convert(self):
     return InstructionTable([_make(self.encodings[i]) for i in range(self.encoding_count)], self.max_instruction_byte_count)
 
-dll = ctypes.CDLL(str(pathlib.Path(__file__).parent / "sim86_shared_debug.dll"))
+try:
+  dll = ctypes.CDLL(str(pathlib.Path(__file__).parent / "sim86_shared_debug.dll"))
+except OSError:
+  # no loadable DLL (e.g. on Linux), the pure Python decoder in sim86_py stands in, see the bottom of this file
+  dll = None
+
+if dll is not None:
 
-_get_version = dll.Sim86_GetVersion
-_get_version.argtypes = []
-_get_version.restype = u32
+  _get_version = dll.Sim86_GetVersion
+  _get_version.argtypes = []
+  _get_version.restype = u32
 
-_decode_8086_instruction = dll.Sim86_Decode8086Instruction
-_decode_8086_instruction.argtypes = [u32, ctypes.c_void_p, ctypes.POINTER(_instruction)]
+  _decode_8086_instruction = dll.Sim86_Decode8086Instruction
+  _decode_8086_instruction.argtypes = [u32, ctypes.c_void_p, ctypes.POINTER(_instruction)]
 
-_register_name_from_operand = dll.Sim86_RegisterNameFromOperand
-_register_name_from_operand.argtypes = [ctypes.POINTER(_register_access)]
-_register_name_from_operand.restype = ctypes.c_char_p
+  _register_name_from_operand = dll.Sim86_RegisterNameFromOperand
+  _register_name_from_operand.argtypes = [ctypes.POINTER(_register_access)]
+  _register_name_from_operand.restype = ctypes.c_char_p
 
-_mnemonic_from_operation_type = dll.Sim86_MnemonicFromOperationType
-_mnemonic_from_operation_type.argtypes = [u32] # OperationType
-_mnemonic_from_operation_type.restype = ctypes.c_char_p
+  _mnemonic_from_operation_type = dll.Sim86_MnemonicFromOperationType
+  _mnemonic_from_operation_type.argtypes = [u32] # OperationType
+  _mnemonic_from_operation_type.restype = ctypes.c_char_p
 
-_get_8086_instruction_table = dll.Sim86_Get8086InstructionTable
-_get_8086_instruction_table.argtypes = [ctypes.POINTER(_instruction_table)]
+  _get_8086_instruction_table = dll.Sim86_Get8086InstructionTable
+  _get_8086_instruction_table.argtypes = [ctypes.POINTER(_instruction_table)]
 
 ### helper function to convert ctypes -> dataclass
 
-def _make(obj):
-  if isinstance(obj, int):     return obj
-  if hasattr(obj, "_convert"): return obj._convert()
+# ctypes struct type -> function that turns one of them into its dataclass,
+# built the first time a type is seen so fields() is only looked at once
+_converters: dict[type, typing.Callable] = {}
+
+def _build_converter(ctype: type) -> typing.Callable:
+  if hasattr(ctype, "_convert"): return ctype._convert
 
-  dst = dict((f.name, f) for f in fields(obj._type_))
+  dst = dict((f.name, f.type) for f in fields(ctype._type_))
 
-  args = {}
-  for field in obj._fields_:
-    value = getattr(obj, field[0])
-    ftype = dst[field[0]].type
+  namespace = {"_type": ctype._type_}
+  args = []
+  for i, (name, field_ctype) in enumerate(ctype._fields_):
+    ftype = dst[name]
     if isinstance(ftype, EnumType):
-      args[field[0]] = ftype(value)
+      namespace[f"_field{i}"] = ftype
+      args.append(f"_field{i}(obj.{name})")
+    elif issubclass(field_ctype, (ctypes.Structure, ctypes.Union)):
+      namespace[f"_field{i}"] = _converter(field_ctype)
+      args.append(f"_field{i}(obj.{name})")
     else:
-      args[field[0]] = _make(value)
+      args.append(f"obj.{name}")
 
-  return obj._type_(**args)
+  exec(f"def convert(obj):\n  return _type({', '.join(args)})\n", namespace)
+  return namespace["convert"]
+
+def _converter(ctype: type) -> typing.Callable:
+  convert = _converters.get(ctype)
+  if convert is None:
+    convert = _converters[ctype] = _build_converter(ctype)
+  return convert
+
+def _make(obj):
+  convert = _converters.get(type(obj))
+  if convert is None:
+    convert = _converter(type(obj))
+  return convert(obj)
+
+
+### backend selection
+
+if dll is not None:
+  BACKEND = "ctypes"
+else:
+  BACKEND = "python"
+  from sim86_py import (
+    get_version,
+    decode_8086_instruction,
+    decode_8086_block,
+    register_name_from_operand,
+    mnemonic_from_operation_type,
+    get_8086_instruction_table,
+  )
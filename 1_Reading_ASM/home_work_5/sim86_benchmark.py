@@ -0,0 +1,45 @@
+import time
+
+import sim86
+import sim86_py
+from sim86_test import example_disassembly
+
+# each backend decodes the example listing this many times
+PASSES = 200
+
+def decode_all(decode, data: bytes) -> list[sim86.Instruction]:
+  decoded_all = []
+  offset = 0
+  while offset < len(data):
+    decoded = decode(data, offset)
+    if decoded.op == sim86.OperationType.none:
+      break
+    decoded_all.append(decoded)
+    offset += decoded.size
+  return decoded_all
+
+def decode_block(decode_block, data: bytes) -> list[sim86.Instruction]:
+  return list(decode_block(data))
+
+def time_backend(name: str, decode, data: bytes, run=decode_all) -> list[sim86.Instruction]:
+  start = time.perf_counter()
+  for _ in range(PASSES):
+    decoded_all = run(decode, data)
+  seconds = time.perf_counter() - start
+  count = len(decoded_all) * PASSES
+  print(f"{name:>12}: {count} instructions in {seconds * 1000:.2f}ms ({count / seconds:,.0f} instructions/s)")
+  return decoded_all
+
+if __name__ == "__main__":
+  print(f"sim86 backend: {sim86.BACKEND}")
+  python_decoded = time_backend("python", sim86_py.decode_8086_instruction, example_disassembly)
+  time_backend("python block", sim86_py.decode_8086_block, example_disassembly, decode_block)
+
+  if sim86.BACKEND == "ctypes":
+    ctypes_decoded = time_backend("ctypes", sim86.decode_8086_instruction, example_disassembly)
+    time_backend("ctypes block", sim86.decode_8086_block, example_disassembly, decode_block)
+    mismatches = sum(a != b for a, b in zip(python_decoded, ctypes_decoded))
+    mismatches += abs(len(python_decoded) - len(ctypes_decoded))
+    print(f"{mismatches} instructions differ between the backends")
+  else:
+    print("sim86_shared_debug.dll did not load, nothing to compare against")
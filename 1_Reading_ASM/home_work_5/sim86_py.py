@@ -0,0 +1,471 @@
+"""
+Pure Python 8086 decoder with the same interface as the sim86 DLL binding.
+
+sim86 falls back to this module when sim86_shared_debug.dll can't be loaded.
+It decodes straight into the sim86_types dataclasses, so callers get the same
+Instruction, RegisterAccess, EffectiveAddressExpression and Immediate types
+either way. The encodings follow the layout of the reference
+sim86_instruction_table.inl. Every encoding is a list of bit fields and
+decoding tries them in table order, but only against the encodings whose
+first byte can match, which are worked out once at import.
+"""
+from sim86_types import (
+  VERSION,
+  OperationType,
+  InstructionFlag,
+  EffectiveAddressFlag,
+  ImmediateFlag,
+  InstructionBitsUsage,
+  RegisterAccess,
+  EffectiveAddressTerm,
+  EffectiveAddressExpression,
+  Immediate,
+  Instruction,
+  InstructionBits,
+  InstructionEncoding,
+  InstructionTable,
+  DecodedBlock,
+)
+
+U = InstructionBitsUsage
+USAGE_COUNT = len(InstructionBitsUsage)
+MAX_INSTRUCTION_BYTE_COUNT = 15
+
+# register indexes as sim86 numbers them
+REGISTER_A, REGISTER_B, REGISTER_C, REGISTER_D = 1, 2, 3, 4
+REGISTER_SP, REGISTER_BP, REGISTER_SI, REGISTER_DI = 5, 6, 7, 8
+REGISTER_ES = 9
+
+# (index, offset, count) for the 3 bit reg field, [byte, word]
+REG_FIELD = [
+  ((REGISTER_A, 0, 1), (REGISTER_A, 0, 2)),
+  ((REGISTER_C, 0, 1), (REGISTER_C, 0, 2)),
+  ((REGISTER_D, 0, 1), (REGISTER_D, 0, 2)),
+  ((REGISTER_B, 0, 1), (REGISTER_B, 0, 2)),
+  ((REGISTER_A, 1, 1), (REGISTER_SP, 0, 2)),
+  ((REGISTER_C, 1, 1), (REGISTER_BP, 0, 2)),
+  ((REGISTER_D, 1, 1), (REGISTER_SI, 0, 2)),
+  ((REGISTER_B, 1, 1), (REGISTER_DI, 0, 2)),
+]
+
+# the two effective address registers for each rm value, 0 when there is no second term
+RM_TERMS = [
+  (REGISTER_B, REGISTER_SI),
+  (REGISTER_B, REGISTER_DI),
+  (REGISTER_BP, REGISTER_SI),
+  (REGISTER_BP, REGISTER_DI),
+  (REGISTER_SI, 0),
+  (REGISTER_DI, 0),
+  (REGISTER_BP, 0),
+  (REGISTER_B, 0),
+]
+
+REGISTER_NAMES = {
+  (REGISTER_A, 0, 2): 'ax', (REGISTER_A, 0, 1): 'al', (REGISTER_A, 1, 1): 'ah',
+  (REGISTER_B, 0, 2): 'bx', (REGISTER_B, 0, 1): 'bl', (REGISTER_B, 1, 1): 'bh',
+  (REGISTER_C, 0, 2): 'cx', (REGISTER_C, 0, 1): 'cl', (REGISTER_C, 1, 1): 'ch',
+  (REGISTER_D, 0, 2): 'dx', (REGISTER_D, 0, 1): 'dl', (REGISTER_D, 1, 1): 'dh',
+  (REGISTER_SP, 0, 2): 'sp', (REGISTER_BP, 0, 2): 'bp',
+  (REGISTER_SI, 0, 2): 'si', (REGISTER_DI, 0, 2): 'di',
+  (9, 0, 2): 'es', (10, 0, 2): 'cs', (11, 0, 2): 'ss', (12, 0, 2): 'ds',
+  (13, 0, 2): 'ip', (14, 0, 2): 'flags',
+}
+
+### encoding table
+
+def B(bits: str):
+  return [(U.literal, len(bits), 0, int(bits, 2))]
+
+def Imp(usage: InstructionBitsUsage, value: int):
+  return [(usage, 0, 0, value)]
+
+def Flag(usage: InstructionBitsUsage):
+  return [(usage, 0, 0, 1)]
+
+D = [(U.d, 1, 0, 0)]
+S = [(U.s, 1, 0, 0)]
+W = [(U.w, 1, 0, 0)]
+V = [(U.v, 1, 0, 0)]
+Z = [(U.z, 1, 0, 0)]
+MOD = [(U.mod, 2, 0, 0)]
+REG = [(U.reg, 3, 0, 0)]
+RM = [(U.rm, 3, 0, 0)]
+SR = [(U.sr, 2, 0, 0)]
+DISP = [(U.disp, 0, 0, 0)]
+ADDR = [(U.disp, 0, 0, 0), (U.disp_always_w, 0, 0, 1)]
+DATA = [(U.data, 0, 0, 0)]
+DATA_IF_W = [(U.w_makes_data_w, 0, 0, 1)]
+REL_JUMP = Flag(U.rel_jump_disp)
+
+def _jump(op: str, bits: str):
+  return (op, B(bits) + DISP + REL_JUMP)
+
+def _arithmetic(op: str, low_bits: str, reg_bits: str, accumulator_bits: str):
+  # the reg/rm, immediate to reg/rm and immediate to accumulator forms of add, sub, cmp...
+  return [
+    (op, B(low_bits) + D + W + MOD + REG + RM),
+    (op, B('100000') + S + W + MOD + B(reg_bits) + RM + DATA + DATA_IF_W),
+    (op, B(accumulator_bits) + W + DATA + DATA_IF_W + Imp(U.reg, 0) + Imp(U.d, 1)),
+  ]
+
+def _logic(op: str, low_bits: str, reg_bits: str, accumulator_bits: str):
+  return [
+    (op, B(low_bits) + D + W + MOD + REG + RM),
+    (op, B('1000000') + W + MOD + B(reg_bits) + RM + DATA + DATA_IF_W),
+    (op, B(accumulator_bits) + W + DATA + DATA_IF_W + Imp(U.reg, 0) + Imp(U.d, 1)),
+  ]
+
+def _shift(op: str, reg_bits: str):
+  return (op, B('110100') + V + W + MOD + B(reg_bits) + RM)
+
+ENCODINGS = [
+  ('mov', B('100010') + D + W + MOD + REG + RM),
+  ('mov', B('1100011') + W + MOD + B('000') + RM + DATA + DATA_IF_W + Imp(U.d, 0)),
+  ('mov', B('1011') + W + REG + DATA + DATA_IF_W + Imp(U.d, 1)),
+  ('mov', B('1010000') + W + ADDR + Imp(U.reg, 0) + Imp(U.mod, 0) + Imp(U.rm, 0b110) + Imp(U.d, 1)),
+  ('mov', B('1010001') + W + ADDR + Imp(U.reg, 0) + Imp(U.mod, 0) + Imp(U.rm, 0b110) + Imp(U.d, 0)),
+  ('mov', B('100011') + D + B('0') + MOD + B('0') + SR + RM + Imp(U.w, 1)),
+
+  ('push', B('11111111') + MOD + B('110') + RM + Imp(U.w, 1)),
+  ('push', B('01010') + REG + Imp(U.w, 1)),
+  ('push', B('000') + SR + B('110') + Imp(U.w, 1)),
+
+  ('pop', B('10001111') + MOD + B('000') + RM + Imp(U.w, 1)),
+  ('pop', B('01011') + REG + Imp(U.w, 1)),
+  ('pop', B('000') + SR + B('111') + Imp(U.w, 1)),
+
+  ('xchg', B('1000011') + W + MOD + REG + RM + Imp(U.d, 1)),
+  ('xchg', B('10010') + REG + Imp(U.mod, 0b11) + Imp(U.w, 1) + Imp(U.rm, 0)),
+
+  ('in', B('1110010') + W + DATA + Imp(U.reg, 0) + Imp(U.d, 1)),
+  ('in', B('1110110') + W + Imp(U.reg, 0) + Imp(U.d, 1) + Imp(U.mod, 0b11) + Imp(U.rm, 0b010) + Flag(U.rm_reg_always_w)),
+  ('out', B('1110011') + W + DATA + Imp(U.reg, 0) + Imp(U.d, 0)),
+  ('out', B('1110111') + W + Imp(U.reg, 0) + Imp(U.d, 0) + Imp(U.mod, 0b11) + Imp(U.rm, 0b010) + Flag(U.rm_reg_always_w)),
+
+  ('xlat', B('11010111')),
+  ('lea', B('10001101') + MOD + REG + RM + Imp(U.d, 1) + Imp(U.w, 1)),
+  ('lds', B('11000101') + MOD + REG + RM + Imp(U.d, 1) + Imp(U.w, 1)),
+  ('les', B('11000100') + MOD + REG + RM + Imp(U.d, 1) + Imp(U.w, 1)),
+  ('lahf', B('10011111')),
+  ('sahf', B('10011110')),
+  ('pushf', B('10011100')),
+  ('popf', B('10011101')),
+
+  *_arithmetic('add', '000000', '000', '0000010'),
+  *_arithmetic('adc', '000100', '010', '0001010'),
+  ('inc', B('1111111') + W + MOD + B('000') + RM),
+  ('inc', B('01000') + REG + Imp(U.w, 1)),
+  ('aaa', B('00110111')),
+  ('daa', B('00100111')),
+
+  *_arithmetic('sub', '001010', '101', '0010110'),
+  *_arithmetic('sbb', '000110', '011', '0001110'),
+  ('dec', B('1111111') + W + MOD + B('001') + RM),
+  ('dec', B('01001') + REG + Imp(U.w, 1)),
+  ('neg', B('1111011') + W + MOD + B('011') + RM),
+
+  *_arithmetic('cmp', '001110', '111', '0011110'),
+  ('aas', B('00111111')),
+  ('das', B('00101111')),
+  ('mul', B('1111011') + W + MOD + B('100') + RM + Imp(U.s, 0)),
+  ('imul', B('1111011') + W + MOD + B('101') + RM + Imp(U.s, 1)),
+  ('aam', B('11010100') + B('00001010')),
+  ('div', B('1111011') + W + MOD + B('110') + RM + Imp(U.s, 0)),
+  ('idiv', B('1111011') + W + MOD + B('111') + RM + Imp(U.s, 1)),
+  ('aad', B('11010101') + B('00001010')),
+  ('cbw', B('10011000')),
+  ('cwd', B('10011001')),
+
+  ('not', B('1111011') + W + MOD + B('010') + RM),
+  _shift('shl', '100'),
+  _shift('shr', '101'),
+  _shift('sar', '111'),
+  _shift('rol', '000'),
+  _shift('ror', '001'),
+  _shift('rcl', '010'),
+  _shift('rcr', '011'),
+
+  *_logic('and', '001000', '100', '0010010'),
+  ('test', B('1000010') + W + MOD + REG + RM),
+  ('test', B('1111011') + W + MOD + B('000') + RM + DATA + DATA_IF_W),
+  ('test', B('1010100') + W + DATA + DATA_IF_W + Imp(U.reg, 0) + Imp(U.d, 1)),
+  *_logic('or', '000010', '001', '0000110'),
+  *_logic('xor', '001100', '110', '0011010'),
+
+  ('rep', B('1111001') + Z),
+  ('movs', B('1010010') + W),
+  ('cmps', B('1010011') + W),
+  ('scas', B('1010111') + W),
+  ('lods', B('1010110') + W),
+  ('stos', B('1010101') + W),
+
+  ('call', B('11101000') + ADDR + REL_JUMP),
+  ('call', B('11111111') + MOD + B('010') + RM + Imp(U.w, 1)),
+  ('call', B('10011010') + ADDR + DATA + DATA_IF_W + Imp(U.w, 1) + Flag(U.far)),
+  ('call', B('11111111') + MOD + B('011') + RM + Imp(U.w, 1) + Flag(U.far)),
+
+  ('jmp', B('11101001') + ADDR + REL_JUMP),
+  ('jmp', B('11101011') + DISP + REL_JUMP),
+  ('jmp', B('11111111') + MOD + B('100') + RM + Imp(U.w, 1)),
+  ('jmp', B('11101010') + ADDR + DATA + DATA_IF_W + Imp(U.w, 1) + Flag(U.far)),
+  ('jmp', B('11111111') + MOD + B('101') + RM + Imp(U.w, 1) + Flag(U.far)),
+
+  ('ret', B('11000011')),
+  ('ret', B('11000010') + DATA + DATA_IF_W + Imp(U.w, 1)),
+  ('retf', B('11001011')),
+  ('retf', B('11001010') + DATA + DATA_IF_W + Imp(U.w, 1)),
+
+  _jump('je', '01110100'),
+  _jump('jl', '01111100'),
+  _jump('jle', '01111110'),
+  _jump('jb', '01110010'),
+  _jump('jbe', '01110110'),
+  _jump('jp', '01111010'),
+  _jump('jo', '01110000'),
+  _jump('js', '01111000'),
+  _jump('jne', '01110101'),
+  _jump('jnl', '01111101'),
+  _jump('jg', '01111111'),
+  _jump('jnb', '01110011'),
+  _jump('ja', '01110111'),
+  _jump('jnp', '01111011'),
+  _jump('jno', '01110001'),
+  _jump('jns', '01111001'),
+  _jump('loop', '11100010'),
+  _jump('loopz', '11100001'),
+  _jump('loopnz', '11100000'),
+  _jump('jcxz', '11100011'),
+
+  ('int', B('11001101') + DATA),
+  ('int3', B('11001100')),
+  ('into', B('11001110')),
+  ('iret', B('11001111')),
+
+  ('clc', B('11111000')),
+  ('cmc', B('11110101')),
+  ('stc', B('11111001')),
+  ('cld', B('11111100')),
+  ('std', B('11111101')),
+  ('cli', B('11111010')),
+  ('sti', B('11111011')),
+  ('hlt', B('11110100')),
+  ('wait', B('10011011')),
+
+  ('lock', B('11110000')),
+  ('segment', B('001') + SR + B('110')),
+]
+
+ENCODING_OPS = [OperationType[op] for op, _ in ENCODINGS]
+ENCODING_BITS = [tuple(bits) for _, bits in ENCODINGS]
+
+def _first_byte_matches(bits, first_byte: int) -> bool:
+  # only literals that sit inside the first byte can rule an encoding out up front
+  position = 8
+  for usage, bit_count, _, value in bits:
+    if not bit_count:
+      continue
+    if bit_count > position:
+      break
+    position -= bit_count
+    if usage == U.literal and (first_byte >> position) & ((1 << bit_count) - 1) != value:
+      return False
+    if not position:
+      break
+  return True
+
+# first byte -> indexes into ENCODINGS worth trying, in table order
+CANDIDATES = [
+  [i for i, bits in enumerate(ENCODING_BITS) if _first_byte_matches(bits, first_byte)]
+  for first_byte in range(256)
+]
+
+### decoding
+
+def _read_value(data: bytes, at: int, end: int, wide: bool, sign_extend: bool):
+  if wide:
+    if at + 2 > end:
+      return None, at
+    return data[at] | (data[at + 1] << 8), at + 2
+  if at >= end:
+    return None, at
+  value = data[at]
+  if sign_extend and value & 0x80:
+    value -= 0x100
+  return value, at + 1
+
+def _register(fields: tuple[int, int, int]) -> RegisterAccess:
+  return RegisterAccess(*fields)
+
+def _try_decode(encoding_index: int, data: bytes, start: int, end: int, segment: int, flags: InstructionFlag):
+  bits = [0] * USAGE_COUNT
+  has_bits = 0
+  pending_count = 0
+  pending = 0
+  at = start
+
+  for usage, bit_count, shift, value in ENCODING_BITS[encoding_index]:
+    read = value
+    if bit_count:
+      if not pending_count:
+        if at >= end:
+          return None
+        pending = data[at]
+        at += 1
+        pending_count = 8
+      pending_count -= bit_count
+      read = (pending >> pending_count) & ((1 << bit_count) - 1)
+    if usage == U.literal:
+      if read != value:
+        return None
+    else:
+      bits[usage] |= read << shift
+      has_bits |= 1 << usage
+
+  mod = bits[U.mod]
+  rm = bits[U.rm]
+  wide = bits[U.w]
+  sign = bits[U.s]
+  has_mod = has_bits & (1 << U.mod)
+  has_direct_address = has_mod and mod == 0b00 and rm == 0b110
+  has_displacement = (has_bits & (1 << U.disp)) or (has_mod and mod in (0b01, 0b10)) or has_direct_address
+  displacement_is_wide = bits[U.disp_always_w] or (has_mod and mod == 0b10) or has_direct_address
+  data_is_wide = bits[U.w_makes_data_w] and not sign and wide
+
+  displacement = 0
+  if has_displacement:
+    displacement, at = _read_value(data, at, end, displacement_is_wide, not displacement_is_wide)
+    if displacement is None:
+      return None
+    if displacement_is_wide and displacement & 0x8000:
+      displacement -= 0x10000
+  immediate = 0
+  if has_bits & (1 << U.data):
+    immediate, at = _read_value(data, at, end, data_is_wide, sign)
+    if immediate is None:
+      return None
+
+  if wide:
+    flags |= InstructionFlag.wide
+  if bits[U.far]:
+    flags |= InstructionFlag.far
+
+  # reg goes first when d is set, like the reference decoder
+  operands = [None, None]
+  reg_slot, mod_slot = (0, 1) if bits[U.d] else (1, 0)
+  if has_bits & (1 << U.sr):
+    operands[reg_slot] = RegisterAccess(REGISTER_ES + (bits[U.sr] & 0b11), 0, 2)
+  if has_bits & (1 << U.reg):
+    operands[reg_slot] = _register(REG_FIELD[bits[U.reg]][wide])
+  if has_mod:
+    if mod == 0b11:
+      operands[mod_slot] = _register(REG_FIELD[rm][wide or bits[U.rm_reg_always_w]])
+    else:
+      if has_direct_address:
+        first, second = 0, 0
+      else:
+        first, second = RM_TERMS[rm]
+      terms = [
+        EffectiveAddressTerm(RegisterAccess(first, 0, 2 if first else 0), 1 if first else 0),
+        EffectiveAddressTerm(RegisterAccess(second, 0, 2 if second else 0), 1 if second else 0),
+      ]
+      address_flags = EffectiveAddressFlag.explicit_segment if flags & InstructionFlag.segment else EffectiveAddressFlag(0)
+      operands[mod_slot] = EffectiveAddressExpression(terms, segment, displacement, address_flags)
+
+  # immediates and the shift count go in whichever slot reg and mod left free
+  last_slot = 1 if operands[0] is not None else 0
+  if bits[U.rel_jump_disp]:
+    operands[last_slot] = Immediate(displacement, ImmediateFlag.relative_jump_displacement)
+  if has_bits & (1 << U.data):
+    operands[last_slot] = Immediate(immediate, ImmediateFlag(0))
+  if has_bits & (1 << U.v):
+    if bits[U.v]:
+      operands[last_slot] = RegisterAccess(REGISTER_C, 0, 1)
+    else:
+      operands[last_slot] = Immediate(1, ImmediateFlag(0))
+
+  return Instruction(
+    start,
+    at - start,
+    ENCODING_OPS[encoding_index],
+    flags,
+    [operand for operand in operands if operand is not None],
+    segment,
+  )
+
+def _decode_one(data: bytes, start: int, end: int, segment: int, flags: InstructionFlag):
+  if start >= end:
+    return None
+  for encoding_index in CANDIDATES[data[start]]:
+    decoded = _try_decode(encoding_index, data, start, end, segment, flags)
+    if decoded is not None:
+      return decoded
+  return None
+
+def _none_instruction(offset: int) -> Instruction:
+  return Instruction(offset, 0, OperationType.none, InstructionFlag(0), [], 0)
+
+### public interface, same as sim86
+
+def get_version() -> int:
+  return VERSION
+
+def decode_8086_instruction(data: bytes, offset: int) -> Instruction:
+  """
+  Decode the instruction at data[offset]. lock and segment prefixes are folded
+  into the instruction that follows them. rep is decoded as its own
+  instruction, as the instruction table lists it. Returns an instruction
+  with op none when the bytes do not decode.
+  """
+  return _decode_at(data, offset, len(data))
+
+def decode_8086_block(data: bytes, start: int = 0, end: int | None = None) -> DecodedBlock:
+  """
+  Decode data[start:end] front to back, stopping at the first bytes that do
+  not decode. The instructions are already built, the block just hands them out.
+  """
+  if end is None:
+    end = len(data)
+  instructions = []
+  offsets = []
+  offset = start
+  while offset < end:
+    decoded = _decode_at(data, offset, end)
+    if decoded.op == OperationType.none:
+      break
+    instructions.append(decoded)
+    offsets.append(offset)
+    offset += decoded.size
+  return DecodedBlock(offsets, offset, instructions.__getitem__)
+
+def _decode_at(data: bytes, offset: int, end: int) -> Instruction:
+  at = offset
+  segment = 0
+  flags = InstructionFlag(0)
+  while at - offset < MAX_INSTRUCTION_BYTE_COUNT:
+    decoded = _decode_one(data, at, end, segment, flags)
+    if decoded is None:
+      return _none_instruction(offset)
+    if decoded.op == OperationType.lock:
+      flags |= InstructionFlag.lock
+    elif decoded.op == OperationType.segment:
+      segment = decoded.operands[0].index
+      flags |= InstructionFlag.segment
+    else:
+      decoded.address = offset
+      decoded.size += at - offset
+      return decoded
+    at += decoded.size
+  return _none_instruction(offset)
+
+def register_name_from_operand(register_access: RegisterAccess) -> str:
+  return REGISTER_NAMES.get((register_access.index, register_access.offset, register_access.count), '')
+
+def mnemonic_from_operation_type(op: OperationType) -> str:
+  return op.name
+
+def get_8086_instruction_table() -> InstructionTable:
+  encodings = [
+    InstructionEncoding(op, [InstructionBits(usage, bit_count, shift, value) for usage, bit_count, shift, value in bits])
+    for op, bits in zip(ENCODING_OPS, ENCODING_BITS)
+  ]
+  return InstructionTable(encodings, MAX_INSTRUCTION_BYTE_COUNT)
@@ -26,13 +26,9 @@ if __name__ == "__main__":
   table = sim86.get_8086_instruction_table()
   print(f"8086 Instruction Instruction Encoding Count: {len(table.encodings)}")
 
-  offset = 0
-  while offset < len(example_disassembly):
-    decoded = sim86.decode_8086_instruction(example_disassembly, offset)
-    if decoded.op != sim86.OperationType.none:
-      offset += decoded.size
-      op = sim86.mnemonic_from_operation_type(decoded.op)
-      print(f"Size:{decoded.size} Op:{op} Flags:0x{decoded.flags:x}")
-    else:
-      print("unrecognized instruction")
-      break
+  block = sim86.decode_8086_block(example_disassembly)
+  for decoded in block:
+    op = sim86.mnemonic_from_operation_type(decoded.op)
+    print(f"Size:{decoded.size} Op:{op} Flags:0x{decoded.flags:x}")
+  if block.stopped_at < len(example_disassembly):
+    print("unrecognized instruction")
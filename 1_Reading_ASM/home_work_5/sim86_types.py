@@ -0,0 +1,159 @@
+"""
+The enums and dataclasses sim86 hands out, shared by the DLL binding in sim86
+and the pure Python decoder in sim86_py so neither has to import the other
+for them.
+"""
+import typing
+from enum import IntEnum, IntFlag
+from dataclasses import dataclass
+
+VERSION = 3
+
+OperationType = IntEnum("OperationType", """
+  none mov push pop xchg in out xlat lea lds les lahf sahf
+  pushf popf add adc inc aaa daa sub sbb dec neg cmp aas
+  das mul imul aam div idiv aad cbw cwd not shl shr sar rol
+  ror rcl rcr and test or xor rep movs cmps scas lods stos
+  call jmp ret retf je jl jle jb jbe jp jo js jne jnl jg jnb
+  ja jnp jno jns loop loopz loopnz jcxz int int3 into iret
+  clc cmc stc cld std cli sti hlt wait esc lock segment
+""".split(), start=0)
+ 
+InstructionFlag = IntFlag("InstructionFlag", """
+  lock rep segment wide far
+""".split())
+
+EffectiveAddressFlag = IntFlag("EffectiveAddressFlag", """
+  explicit_segment
+""".split())
+
+ImmediateFlag = IntFlag("ImmediateFlag", """
+  relative_jump_displacement
+""".split())
+
+InstructionBitsUsage = IntEnum("InstructionBitsUsage", """
+  end literal d s w v z mod reg rm sr disp data
+  disp_always_w w_makes_data_w rm_reg_always_w
+  rel_jump_disp far
+""".split(), start=0)
+
+registers_dict = {
+  1: 'ax',
+  2: 'bx',
+  3: 'cx',
+  4: 'dx',
+  5: 'sp',
+  6: 'bp',
+  7: 'si',
+  8: 'di',
+  8: 'di',
+  9: 'es',
+  11: 'ss',
+  12: 'ds'
+}
+
+@dataclass
+class RegisterAccess:
+  index: int
+  offset: int
+  count: int
+
+  def __str__(self):
+    if self.offset:
+      return f"{registers_dict[self.index][0]}l"
+    return f"{registers_dict[self.index]}"
+
+@dataclass
+class EffectiveAddressTerm:
+  register: RegisterAccess
+  scale: int
+
+@dataclass
+class EffectiveAddressExpression:
+  terms: list[EffectiveAddressTerm]
+  explicit_segment: int
+  displacement: int
+  flags: EffectiveAddressFlag
+
+  def __str__(self):
+    parts = [str(term.register) for term in self.terms if term.register.index]
+    if self.displacement or not parts:
+      parts.append(str(self.displacement))
+    address = f"[{' + '.join(parts)}]".replace("+ -", "- ")
+    if self.flags & EffectiveAddressFlag.explicit_segment:
+      return f"{registers_dict.get(self.explicit_segment, 'cs')}:{address}"
+    return address
+
+@dataclass
+class Immediate:
+  value: int
+  flags: ImmediateFlag
+
+  def __str__(self):
+    return str(self.value)
+    
+@dataclass
+class Instruction:
+  address: int
+  size: int
+  op: OperationType
+  flags: InstructionFlag
+  operands: list[typing.Union[EffectiveAddressExpression, RegisterAccess, Immediate]]
+  segment_override: int
+
+  def __str__(self):
+    operands = [str(operand) for operand in self.operands]
+    return f"{self.op.name} {(', ').join(operands)}"
+
+@dataclass
+class InstructionBits:
+  usage: InstructionBitsUsage
+  bit_count: int
+  shift: int
+  value: int
+
+  @staticmethod
+  def _convert(arg):
+    return 
+
+@dataclass
+class InstructionEncoding:
+  op: OperationType
+  bits: list[InstructionBits]
+
+@dataclass
+class InstructionTable:
+  encodings: list[InstructionEncoding]
+  max_instruction_byte_count: int
+
+class DecodedBlock:
+  """
+  Instructions decoded back to back over data[start:end]. offsets[i] is where
+  instruction i starts, the Instruction itself is only built the first time it
+  is indexed. stopped_at is end when the whole range decoded, otherwise the
+  offset of the bytes that did not.
+  """
+  def __init__(self, offsets: list[int], stopped_at: int, load: typing.Callable[[int], Instruction]):
+    self.offsets = offsets
+    self.stopped_at = stopped_at
+    self._load = load
+    self._instructions: list[Instruction | None] = [None] * len(offsets)
+    self._index_of: dict[int, int] | None = None
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def __getitem__(self, i: int) -> Instruction:
+    instruction = self._instructions[i]
+    if instruction is None:
+      instruction = self._instructions[i] = self._load(i)
+    return instruction
+
+  def __iter__(self):
+    for i in range(len(self.offsets)):
+      yield self[i]
+
+  def index_of(self, offset: int) -> int | None:
+    if self._index_of is None:
+      self._index_of = {offset: i for i, offset in enumerate(self.offsets)}
+    return self._index_of.get(offset)
@@ -0,0 +1,90 @@
+import sys
+import struct
+from collections import deque
+from typing import TextIO
+
+# one binary record: address, size, op, flag bits, then the 12 registers
+TRACE_RECORD = struct.Struct('<HBBH12H')
+
+class TraceSink:
+    """
+    Where the VM sends each executed instruction. The base class keeps
+    nothing, the VM skips calling it entirely when it is NULL_TRACE.
+    """
+    def record(self, vm, decoded_inst):
+        pass
+
+    def dump(self) -> list[str]:
+        return []
+
+    def close(self):
+        pass
+
+NULL_TRACE = TraceSink()
+
+class TextTrace(TraceSink):
+    """
+    The old behaviour, one line per instruction written to a stream.
+    """
+    def __init__(self, stream: TextIO = None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def record(self, vm, decoded_inst):
+        if vm.clocks is None:
+            self.stream.write(f"{decoded_inst} flags: {vm.get_flags()}\n")
+        else:
+            self.stream.write(f"{decoded_inst} flags: {vm.get_flags()} ; clocks: +{vm.clocks.last} = {vm.clocks.total}\n")
+
+class RingBufferTrace(TraceSink):
+    """
+    Keeps the last size instructions with the registers and flags after each,
+    for a post-mortem once something has gone wrong.
+    """
+    def __init__(self, size: int = 64):
+        self.entries = deque(maxlen=size)
+
+    def record(self, vm, decoded_inst):
+        self.entries.append((decoded_inst, tuple(vm.registers.values()), vm.get_flag_bits()))
+
+    def dump(self) -> list[str]:
+        lines = []
+        for decoded_inst, registers, flag_bits in self.entries:
+            lines.append(f"{decoded_inst.address:04x}: {decoded_inst} flags: {flag_bits:04x} registers: {registers[:8]}")
+        return lines
+
+class BinaryTraceFile(TraceSink):
+    """
+    Appends a fixed size TRACE_RECORD per instruction to a file, read it back
+    with read_binary_trace.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.pack = TRACE_RECORD.pack
+
+    def record(self, vm, decoded_inst):
+        self.file.write(self.pack(
+            decoded_inst.address, decoded_inst.size, decoded_inst.op, vm.get_flag_bits(), *vm.registers.values()
+        ))
+
+    def close(self):
+        self.file.close()
+
+def read_binary_trace(path) -> list[tuple]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    return [record for record in TRACE_RECORD.iter_unpack(data)]
+
+def make_trace(spec: str) -> TraceSink:
+    """
+    none, text, ring or ring:<size>, file:<path>
+    """
+    kind, _, argument = spec.partition(':')
+    if kind == 'none':
+        return NULL_TRACE
+    if kind == 'text':
+        return TextTrace()
+    if kind == 'ring':
+        return RingBufferTrace(int(argument) if argument else 64)
+    if kind == 'file':
+        return BinaryTraceFile(argument or 'trace.bin')
+    raise ValueError(f"Unknown trace sink {spec!r}")
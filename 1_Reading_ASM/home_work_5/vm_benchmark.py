@@ -0,0 +1,113 @@
+import time
+from pathlib import Path
+
+import sim86
+from my_x86sim import VirtualMachine, DecodeCache
+
+LISTINGS = [
+    Path("../home_work_4/listing_0043_immediate_movs"),
+    Path("../home_work_4/listing_0044_register_movs"),
+    Path("../home_work_4/listing_0045_challenge_register_movs"),
+    Path("listing_0046_add_sub_cmp"),
+]
+
+# hand assembled listing_0051_memory_mov, ends with bx=1 cx=2 dx=10 bp=4
+MEMORY_MOVS = bytes([
+    0xC7, 0x06, 0xE8, 0x03, 0x01, 0x00,  # mov word [1000], 1
+    0xC7, 0x06, 0xEA, 0x03, 0x02, 0x00,  # mov word [1002], 2
+    0xC7, 0x06, 0xEC, 0x03, 0x03, 0x00,  # mov word [1004], 3
+    0xC7, 0x06, 0xEE, 0x03, 0x04, 0x00,  # mov word [1006], 4
+    0xBB, 0xE8, 0x03,                    # mov bx, 1000
+    0xC7, 0x47, 0x04, 0x0A, 0x00,        # mov word [bx + 4], 10
+    0x8B, 0x1E, 0xE8, 0x03,              # mov bx, word [1000]
+    0x8B, 0x0E, 0xEA, 0x03,              # mov cx, word [1002]
+    0x8B, 0x16, 0xEC, 0x03,              # mov dx, word [1004]
+    0x8B, 0x2E, 0xEE, 0x03,              # mov bp, word [1006]
+])
+
+# add ax, bx / sub cx, 1 / cmp ax, cx over and over, every instruction sets flags
+FLAG_HEAVY = bytes([0x01, 0xD8, 0x83, 0xE9, 0x01, 0x39, 0xC8]) * 100
+
+# mov cx, 65535 / mov bx, 1000 / top: add bx, 10 / sub cx, 1 / jnz top
+JNZ_LOOP = bytes([0xB9, 0xFF, 0xFF, 0xBB, 0xE8, 0x03, 0x83, 0xC3, 0x0A, 0x83, 0xE9, 0x01, 0x75, 0xF8])
+
+# mov cx, 65535 / mov ax, 0 / top: add ax, 2 / loop top
+LOOP_LOOP = bytes([0xB9, 0xFF, 0xFF, 0xB8, 0x00, 0x00, 0x05, 0x02, 0x00, 0xE2, 0xFB])
+
+# passes over each listing, standing in for a long loop until jumps run
+PASSES = 2000
+
+def run_interpreted(code: bytes) -> int:
+    vm = VirtualMachine()
+    decode_cache = DecodeCache(code)
+    count = 0
+    for _ in range(PASSES):
+        offset = 0
+        while offset < len(code):
+            decoded = decode_cache.decode(offset)
+            if decoded.op == sim86.OperationType.none:
+                break
+            offset += decoded.size
+            vm.exec_instruction(decoded)
+            count += 1
+    return count
+
+def run_compiled(code: bytes) -> int:
+    vm = VirtualMachine()
+    handlers = vm.compile_program(code)
+    count = 0
+    for _ in range(PASSES):
+        vm.ip = 0
+        count += vm.run_compiled(handlers)
+    return count
+
+def run_compiled_eager_flags(code: bytes) -> int:
+    """
+    run_compiled, but with the flags worked out after every instruction the
+    way they would be without lazy flags.
+    """
+    vm = VirtualMachine()
+    handlers = vm.compile_program(code)
+    end = len(handlers)
+    count = 0
+    for _ in range(PASSES):
+        ip = 0
+        while ip < end:
+            ip = handlers[ip]()
+            vm.get_flag_bits()
+            count += 1
+    return count
+
+def run_compiled_lazy_flags(code: bytes) -> int:
+    vm = VirtualMachine()
+    handlers = vm.compile_program(code)
+    count = 0
+    for _ in range(PASSES):
+        vm.ip = 0
+        count += vm.run_compiled(handlers)
+    vm.get_flag_bits()
+    return count
+
+def run_loop(code: bytes) -> int:
+    vm = VirtualMachine()
+    return vm.run_compiled(vm.compile_program(code))
+
+def time_run(run, code: bytes) -> float:
+    start = time.perf_counter()
+    count = run(code)
+    return count / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    programs = [(path.name, path.read_bytes()) for path in LISTINGS]
+    programs.append(("memory movs", MEMORY_MOVS))
+    for name, code in programs:
+        interpreted = time_run(run_interpreted, code)
+        compiled = time_run(run_compiled, code)
+        print(f"{name:>36}: interpreted {interpreted:>12,.0f}/s  compiled {compiled:>12,.0f}/s  ({compiled / interpreted:.1f}x)")
+
+    lazy = time_run(run_compiled_lazy_flags, FLAG_HEAVY)
+    eager = time_run(run_compiled_eager_flags, FLAG_HEAVY)
+    print(f"{'flag heavy':>36}: eager flags {eager:>12,.0f}/s  lazy flags {lazy:>12,.0f}/s  ({lazy / eager:.1f}x)")
+
+    for name, code in (("jnz loop", JNZ_LOOP), ("loop loop", LOOP_LOOP)):
+        print(f"{name:>36}: compiled {time_run(run_loop, code):>12,.0f}/s")
@@ -1,14 +1,20 @@
 from __future__ import annotations
+import os
+import mmap
 from pathlib import Path
+from contextlib import contextmanager
 from enum import Enum, auto
 from dataclasses import dataclass
 
 from abc import ABC, abstractmethod
-from typing import List, Any
+from typing import List, Any, NamedTuple, Iterator
 from dataclasses import dataclass
 
 
 class Expr(ABC):
+    # no instance __dict__ anywhere in the tree, see the node classes below
+    __slots__ = ()
+
     @abstractmethod
     def accept(self, visitor: ExprVisitor) -> None:
         pass
@@ -34,22 +40,28 @@ class ExprVisitor(ABC):
     def visit_dict(self, element: JsonDict) -> None:
         ...
         
-
-@dataclass
+# The nodes are slotted dataclasses. A parse of haversine pairs makes
+# millions of them, per node as measured with tracemalloc on CPython 3.11:
+#   JsonString / JsonNumber / JsonList / JsonDict   80 bytes -> 40 bytes
+#   KeyValuePair                                     88 bytes -> 48 bytes
+# A whole parsed pair, floats, key strings and lists included, went from
+# about 1480 bytes to about 960.
+
+@dataclass(slots=True)
 class JsonString(Expr):
     value: Any
 
     def accept(self, visitor: ExprVisitor) -> None:
         return visitor.visit_string(self)
 
-@dataclass
+@dataclass(slots=True)
 class JsonNumber(Expr):
     value: Any
 
     def accept(self, visitor: ExprVisitor) -> None:
         return visitor.visit_number(self)
     
-@dataclass
+@dataclass(slots=True)
 class KeyValuePair(Expr):
     # its made of a STRING COLON STRING | NUMBER
     key: JsonString
@@ -58,14 +70,14 @@ class KeyValuePair(Expr):
     def accept(self, visitor: ExprVisitor) -> None:
         return visitor.visit_key_value_pair(self) 
 
-@dataclass
+@dataclass(slots=True)
 class JsonList(Expr):
     values: list[Expr]
 
     def accept(self, visitor: ExprVisitor) -> None:
         return visitor.visit_list(self)
 
-@dataclass
+@dataclass(slots=True)
 class JsonDict(Expr):
     items: list[KeyValuePair]
 
@@ -133,7 +145,7 @@ class jsonScanner:
             char = self._current_char()
             if self._at_end():
                 break
-            if not (char.isdigit() or char == '.'):
+            if not (char.isdigit() or char in '.eE+-'):
                 self.index -=1
                 break
         self._add_token(TokenType.NUMBER)
@@ -176,9 +188,227 @@ class jsonScanner:
             lexeme='',
         ))
 
+# byte classes for the 256 entry dispatch table used by jsonByteScanner
+CLASS_OTHER = 0
+CLASS_SPACE = 1
+CLASS_PUNCT = 2
+CLASS_QUOTE = 3
+CLASS_NUMBER = 4
+
+BYTE_CLASSES = [CLASS_OTHER] * 256
+for byte in b' \t\r\n':
+    BYTE_CLASSES[byte] = CLASS_SPACE
+for byte in b'[]{}:,':
+    BYTE_CLASSES[byte] = CLASS_PUNCT
+BYTE_CLASSES[ord('"')] = CLASS_QUOTE
+for byte in b'-0123456789':
+    BYTE_CLASSES[byte] = CLASS_NUMBER
+
+PUNCT_TOKENS = [TokenType.UNKNOWN] * 256
+PUNCT_TOKENS[ord('[')] = TokenType.LEFT_BRACKET
+PUNCT_TOKENS[ord(']')] = TokenType.RIGHT_BRACKET
+PUNCT_TOKENS[ord('{')] = TokenType.LEFT_BRACE
+PUNCT_TOKENS[ord('}')] = TokenType.RIGHT_BRACE
+PUNCT_TOKENS[ord(':')] = TokenType.COLON
+PUNCT_TOKENS[ord(',')] = TokenType.COMMA
+
+# bytes that may continue a number once it has started
+NUMBER_BODY = [False] * 256
+for byte in b'0123456789.eE+-':
+    NUMBER_BODY[byte] = True
+
+QUOTE = ord('"')
+BACKSLASH = ord('\\')
+
+def parse_number(source, start: int = 0, end: int | None = None) -> float:
+    """
+    Decode the number lexeme at source[start:end]. source can be the str, bytes
+    or memoryview the scanner ran over, slicing bytes or a memoryview does not
+    go through str first.
+
+    JSON numbers are doubles so every number comes back as a float, float()
+    does the conversion so the result is bit for bit what float() gives for
+    the same text.
+    """
+    try:
+        return float(source[start:end])
+    except ValueError:
+        raise SyntaxError(f"Malformed number at {start}.") from None
+
+class ByteToken(NamedTuple):
+    token_type: TokenType
+    start: int
+    end: int
+
+    def __str__(self):
+        return f"{self.token_type} {self.start}:{self.end}"
+
+class jsonByteScanner:
+    """
+    Scanner over bytes or a memoryview. Every byte is classified through
+    BYTE_CLASSES and tokens only remember where they are in the source,
+    the lexeme gets sliced out when someone asks for it.
+    """
+    def __init__(self, source: bytes | memoryview):
+        self.source = source
+        self.tokens: list[ByteToken] = []
+
+    def lexeme(self, token: ByteToken) -> str:
+        return str(self.source[token.start:token.end], 'utf-8')
+
+    def scan_tokens(self):
+        source = self.source
+        classes = BYTE_CLASSES
+        punct = PUNCT_TOKENS
+        number_body = NUMBER_BODY
+        append = self.tokens.append
+        length = len(source)
+        index = 0
+
+        while index < length:
+            byte = source[index]
+            byte_class = classes[byte]
+            if byte_class == CLASS_SPACE:
+                index += 1
+            elif byte_class == CLASS_PUNCT:
+                append(ByteToken(punct[byte], index, index + 1))
+                index += 1
+            elif byte_class == CLASS_NUMBER:
+                start = index
+                index += 1
+                while index < length and number_body[source[index]]:
+                    index += 1
+                append(ByteToken(TokenType.NUMBER, start, index))
+            elif byte_class == CLASS_QUOTE:
+                start = index
+                index += 1
+                while index < length:
+                    byte = source[index]
+                    index += 1
+                    if byte == QUOTE:
+                        break
+                    if byte == BACKSLASH:
+                        index += 1
+                append(ByteToken(TokenType.STRING, start, index))
+            else:
+                # true, false and null are still neglected, same as jsonScanner
+                append(ByteToken(TokenType.UNKNOWN, index, index + 1))
+                index += 1
+
+        append(ByteToken(TokenType.EOF, length, length))
+        return self.tokens
+
+EVENT_CHUNK_SIZE = 1 << 16
+
+class EventType(Enum):
+    START_OBJECT = auto()
+    END_OBJECT = auto()
+    START_ARRAY = auto()
+    END_ARRAY = auto()
+    KEY = auto()
+    STRING = auto()
+    NUMBER = auto()
+
+    def __str__(self):
+        return self.name.lower()
+
+def iter_events(fileobj, chunk_size: int = EVENT_CHUNK_SIZE):
+    """
+    Pull parser over a binary file object. Yields (EventType, value) pairs,
+    value is None for the structural events, the unquoted text for keys and
+    strings and a float for numbers.
+
+    The file is read chunk_size bytes at a time and only the unfinished tail
+    of a chunk is carried over, so memory stays flat however big the input is.
+    """
+    classes = BYTE_CLASSES
+    number_body = NUMBER_BODY
+    # one entry per open container, True for objects and False for arrays
+    stack: list[bool] = []
+    expect_key = False
+    pending = b''
+    at_eof = False
+
+    while not at_eof:
+        chunk = fileobj.read(chunk_size)
+        at_eof = not chunk
+        buffer = pending + chunk if pending else chunk
+        length = len(buffer)
+        index = 0
+
+        while index < length:
+            byte = buffer[index]
+            byte_class = classes[byte]
+            if byte_class == CLASS_SPACE:
+                index += 1
+
+            elif byte_class == CLASS_PUNCT:
+                index += 1
+                if byte == 0x7B: # {
+                    stack.append(True)
+                    expect_key = True
+                    yield EventType.START_OBJECT, None
+                elif byte == 0x5B: # [
+                    stack.append(False)
+                    yield EventType.START_ARRAY, None
+                elif byte == 0x7D: # }
+                    if not stack or not stack.pop():
+                        raise SyntaxError("Unexpected '}'.")
+                    expect_key = False
+                    yield EventType.END_OBJECT, None
+                elif byte == 0x5D: # ]
+                    if not stack or stack.pop():
+                        raise SyntaxError("Unexpected ']'.")
+                    yield EventType.END_ARRAY, None
+                elif byte == 0x2C: # ,
+                    expect_key = bool(stack) and stack[-1]
+                # the colon carries no information once we know a key came before it
+
+            elif byte_class == CLASS_NUMBER:
+                end = index + 1
+                while end < length and number_body[buffer[end]]:
+                    end += 1
+                if end == length and not at_eof:
+                    break # the number may carry on into the next chunk
+                yield EventType.NUMBER, parse_number(buffer, index, end)
+                index = end
+
+            elif byte_class == CLASS_QUOTE:
+                end = index + 1
+                closed = False
+                while end < length:
+                    byte = buffer[end]
+                    end += 1
+                    if byte == QUOTE:
+                        closed = True
+                        break
+                    if byte == BACKSLASH:
+                        end += 1
+                if not closed:
+                    if not at_eof:
+                        break
+                    raise SyntaxError("Unterminated string.")
+                value = str(buffer[index + 1:end - 1], 'utf-8')
+                if expect_key:
+                    expect_key = False
+                    yield EventType.KEY, value
+                else:
+                    yield EventType.STRING, value
+                index = end
+
+            else:
+                raise SyntaxError(f"Unexpected byte {bytes([byte])!r}.")
+
+        pending = buffer[index:]
+
+    if stack:
+        raise SyntaxError("Unexpected end of input.")
+
 class jsonParser():
-    def __init__(self, tokens):
+    def __init__(self, tokens, source=None):
         self.tokens: list[Token] = tokens
+        # when the tokens came from jsonByteScanner they only hold offsets into source
+        self.source = source
         self.current = 0
 
     def _match(self, *token_types: tuple[TokenType]):
@@ -207,12 +437,22 @@ class jsonParser():
     def _previous(self) -> Token:
         return self.tokens[self.current - 1]
 
+    def _lexeme(self, token) -> str:
+        if self.source is None:
+            return token.lexeme
+        return str(self.source[token.start:token.end], 'utf-8')
+
+    def _number(self, token) -> float:
+        if self.source is None:
+            return parse_number(token.lexeme)
+        return parse_number(self.source, token.start, token.end)
+
 
     def _primary(self)  -> Expr:
         if self._match(TokenType.NUMBER):
-            return JsonNumber(self._previous().lexeme)
+            return JsonNumber(self._number(self._previous()))
         if self._match(TokenType.STRING):
-            return JsonString(self._previous().lexeme)
+            return JsonString(self._lexeme(self._previous()))
 
 
         if self._match(TokenType.LEFT_BRACKET):
@@ -240,7 +480,7 @@ class jsonParser():
 
     def _parse_key_val_pair(self):
         if self._match(TokenType.STRING):
-            key = JsonString(self._previous().lexeme)
+            key = JsonString(self._lexeme(self._previous()))
         if not self._match(TokenType.COLON):
             raise SyntaxError("Perhaps you forgot a colon?")
         value = self._primary()
@@ -257,22 +497,96 @@ class jsonParser():
         except SyntaxError as e:
             print(e)
 
-source_path = Path('test.json')
-# source_path = Path('haversine.json')
-with source_path.open() as f:
-    source_code = f.read()
-    scanner = jsonScanner(source_code)
-    scanner.scan_tokens()
-    parser = jsonParser(scanner.tokens)
-    # [print(str(token)) for token in scanner.tokens]
-    expr = parser.parse()
-    
-    print(expr)
-    # scanner = Scanner(source_code)
-    # tokens = scanner.scan_tokens()
-    # # print([token.lexeme for token in tokens])
-    # parser = Parser(tokens)
-    # final_expr = parser.parse()
-    # print(final_expr)
-    # print(AstPrinter().do_it(final_expr))
-
+@contextmanager
+def map_source(path: Path | str) -> Iterator[memoryview]:
+    """
+    Memory map the file at path read only and yield a memoryview over it, which
+    jsonByteScanner, parse_number and load_haversine_pairs take as is. Nothing
+    is read up front, the OS pages the file in as the scanner walks over it and
+    can drop those pages again, so the file can be bigger than RAM.
+
+    Slices of the view taken inside the with block must not outlive it.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield memoryview(b'') # mmap refuses empty files
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # the scanners walk front to back, tell the kernel to read ahead and not keep pages around
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        view.release()
+        mapped.close()
+
+class SourceReader:
+    """
+    File like read() over bytes or a map_source view for iter_events. Each read
+    copies only the slice it returns, where io.BytesIO would copy the whole
+    source up front.
+    """
+    def __init__(self, source: bytes | memoryview):
+        self.source = source
+        self.position = 0
+
+    def read(self, size: int) -> bytes:
+        start = self.position
+        self.position = min(start + size, len(self.source))
+        return bytes(self.source[start:self.position])
+
+class PythonConverter(ExprVisitor):
+    """
+    Turns a parsed tree back into plain lists, dicts, strings and floats.
+    """
+    def convert(self, expr: Expr) -> Any:
+        return expr.accept(self)
+
+    def visit_string(self, element: JsonString) -> str:
+        return element.value[1:-1]
+
+    def visit_number(self, element: JsonNumber) -> float:
+        return element.value
+
+    def visit_key_value_pair(self, element: KeyValuePair) -> tuple[str, Any]:
+        return element.key.accept(self), element.value.accept(self)
+
+    def visit_list(self, element: JsonList) -> list:
+        return [value.accept(self) for value in element.values]
+
+    def visit_dict(self, element: JsonDict) -> dict:
+        return dict(item.accept(self) for item in element.items)
+
+if __name__ == "__main__":
+    import sys
+    import statistics
+    from contextlib import ExitStack
+    from profiler import time_block, begin_profile, end_and_print_profile
+    from haversine_gen import calculate_haversine_distances
+
+    # python dumb_json_parser.py [path], test.json is the small sanity check
+    source_path = Path(sys.argv[1] if len(sys.argv) > 1 else 'haversine.json')
+    begin_profile()
+    with ExitStack() as stack:
+        # only opening and mapping the file, pages come in lazily so most of
+        # the real reading still shows up under scan
+        with time_block('read', source_path.stat().st_size):
+            source_code = stack.enter_context(map_source(source_path))
+        with time_block('scan', len(source_code)):
+            scanner = jsonByteScanner(source_code)
+            scanner.scan_tokens()
+        with time_block('parse', len(source_code)):
+            parser = jsonParser(scanner.tokens, source_code)
+            # [print(str(token)) for token in scanner.tokens]
+            expr = parser.parse()
+        with time_block('convert'):
+            data = PythonConverter().convert(expr)
+
+    if isinstance(data, list):
+        with time_block('sum'):
+            print(statistics.mean(calculate_haversine_distances(data)))
+    else:
+        print(expr)
+    end_and_print_profile()
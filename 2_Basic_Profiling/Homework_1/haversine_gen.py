@@ -1,31 +1,97 @@
-import json
+import sys
 import random
 import string
 import math
-import statistics
-
-def generate_haversine_data_json():
-    data = []
-    cluster_min_y = random.uniform(-90, -10)
-    cluster_max_y = random.uniform(10, 90)
-    cluster_min_x = random.uniform(-180, -10)
-    cluster_max_x = random.uniform(10, 180)
-
-    cluster_min_y0 = random.uniform(-90, -10)
-    cluster_max_y0 = random.uniform(10, 90)
-    cluster_min_x0 = random.uniform(-180, -10)
-    cluster_max_x0 = random.uniform(10, 180)
-
-    for i in range(1):
-        x0 = random.uniform(cluster_min_x0, cluster_max_x0)
-        y0 = random.uniform(cluster_min_y0, cluster_max_y0)
-        x1 = random.uniform(cluster_min_x, cluster_max_x)
-        y1 = random.uniform(cluster_min_y, cluster_max_y)
-        data.append({'x0': x0,'y0': y0,'x1': x1,'y1': y1})
-
-    with open('haversine.json', 'w') as f:
-        json.dump(data, f)
-    return data
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Radius of Earth in kilometers. For miles, use 3956 instead.
+EARTH_RADIUS = 6371
+
+# pairs are formatted and written this many at a time
+GENERATE_CHUNK_PAIRS = 4096
+CLUSTER_COUNT = 64
+
+def _random_cluster(rng: random.Random):
+    min_x = rng.uniform(-180, -10)
+    max_x = rng.uniform(10, 180)
+    min_y = rng.uniform(-90, -10)
+    max_y = rng.uniform(10, 90)
+    return min_x, max_x, min_y, max_y
+
+def generate_haversine_data_json(
+        pair_count: int = 1,
+        seed: int = 0,
+        path: str = 'haversine.json',
+        answers_path: str = 'haversine_answers.f64',
+        cluster_count: int = CLUSTER_COUNT,
+        ) -> float:
+    """
+    Write pair_count random point pairs to path as [{"x0":..,"y0":..,"x1":..,"y1":..}, ...].
+
+    The same seed always gives the same file. Points are drawn from a pair of
+    clusters that is re-rolled cluster_count times over the run, so the data
+    is not just uniform noise. Pairs are written GENERATE_CHUNK_PAIRS at a time
+    so memory use does not depend on pair_count.
+
+    answers_path gets every distance as a native float64 followed by the mean,
+    to check parsers against without recomputing.
+
+    Returns the mean distance.
+    """
+    rng = random.Random(seed)
+    uniform = rng.uniform
+    pairs_per_cluster = max(1, pair_count // max(1, cluster_count))
+    total = 0.0
+
+    with open(path, 'w') as f, open(answers_path, 'wb') as answers:
+        f.write('[')
+        written = 0
+        while written < pair_count:
+            chunk_size = min(GENERATE_CHUNK_PAIRS, pair_count - written)
+            lines = []
+            distances = array('d', bytes(8 * chunk_size))
+            for i in range(chunk_size):
+                if (written + i) % pairs_per_cluster == 0:
+                    min_x0, max_x0, min_y0, max_y0 = _random_cluster(rng)
+                    min_x1, max_x1, min_y1, max_y1 = _random_cluster(rng)
+                x0 = uniform(min_x0, max_x0)
+                y0 = uniform(min_y0, max_y0)
+                x1 = uniform(min_x1, max_x1)
+                y1 = uniform(min_y1, max_y1)
+                lines.append(f'{{"x0": {x0!r}, "y0": {y0!r}, "x1": {x1!r}, "y1": {y1!r}}}')
+                distance = haversine_distance(y0, x0, y1, x1)
+                distances[i] = distance
+                total += distance
+            if written:
+                f.write(', ')
+            f.write(', '.join(lines))
+            distances.tofile(answers)
+            written += chunk_size
+        f.write(']')
+
+        mean = total / pair_count if pair_count else 0.0
+        array('d', [mean]).tofile(answers)
+    return mean
+
+def read_haversine_answers(answers_path: str = 'haversine_answers.f64'):
+    """
+    Read back an answers file from generate_haversine_data_json.
+
+    Returns (distances, mean).
+    """
+    answers = array('d')
+    with open(answers_path, 'rb') as f:
+        answers.frombytes(f.read())
+    mean = answers.pop()
+    return answers, mean
 
 def calculate_haversine_distances(data):
     """
@@ -83,9 +149,86 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
     c = 2 * math.asin(math.sqrt(a))
     
-    # Radius of Earth in kilometers. For miles, use 3956 instead.
-    r = 6371  
-    return c * r
+    return c * EARTH_RADIUS
+
+@dataclass
+class HaversineBatch:
+    distances: Any
+    mean: float
+    pair_count: int
+    seconds: float
+    # sum of the distances, partial batches are combined through this
+    total: float = 0.0
+
+    @property
+    def pairs_per_second(self) -> float:
+        if not self.seconds:
+            return 0.0
+        return self.pair_count / self.seconds
+
+    def __str__(self):
+        return f"{self.pair_count} pairs, mean {self.mean}, {self.pairs_per_second:,.0f} pairs/s"
+
+def haversine_batch(x0, y0, x1, y1, use_numpy: bool | None = None) -> HaversineBatch:
+    """
+    Haversine distance for whole columns at once, x is longitude and y is
+    latitude like in calculate_haversine_distances. The columns can be lists,
+    array('d') or numpy arrays, e.g. straight out of load_haversine_pairs.
+
+    Returns the distances, their mean and how fast it went.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    elif use_numpy and np is None:
+        raise ImportError("numpy is not installed")
+
+    pair_count = len(x0)
+    start = time.perf_counter()
+    if use_numpy:
+        distances = _haversine_numpy(x0, y0, x1, y1)
+        total = float(distances.sum())
+    else:
+        distances, total = _haversine_arrays(x0, y0, x1, y1)
+    seconds = time.perf_counter() - start
+
+    mean = total / pair_count if pair_count else 0.0
+    return HaversineBatch(distances, mean, pair_count, seconds, total)
+
+def _haversine_numpy(x0, y0, x1, y1):
+    lon1 = np.radians(np.asarray(x0, dtype=np.float64))
+    lat1 = np.radians(np.asarray(y0, dtype=np.float64))
+    lon2 = np.radians(np.asarray(x1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(y1, dtype=np.float64))
+
+    a = np.sin((lat2 - lat1) * 0.5)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) * 0.5)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+def _haversine_arrays(x0, y0, x1, y1):
+    # everything the loop touches is a local, the arithmetic is kept in the same
+    # order as haversine_distance so both give bit identical distances
+    sin = math.sin
+    cos = math.cos
+    asin = math.asin
+    sqrt = math.sqrt
+    to_radians = math.pi / 180
+    diameter = 2 * EARTH_RADIUS
+
+    distances = array('d', bytes(8 * len(x0)))
+    total = 0.0
+    i = 0
+    for lon1, lat1, lon2, lat2 in zip(x0, y0, x1, y1):
+        lat1 *= to_radians
+        lat2 *= to_radians
+        dlon = lon2 * to_radians - lon1 * to_radians
+        a = sin((lat2 - lat1) * 0.5)**2 + cos(lat1) * cos(lat2) * sin(dlon * 0.5)**2
+        distance = diameter * asin(sqrt(a))
+        distances[i] = distance
+        total += distance
+        i += 1
+    return distances, total
 
-data = generate_haversine_data_json()
-print(statistics.mean(calculate_haversine_distances(data)))  # = 20.11111111111111
+if __name__ == "__main__":
+    # python haversine_gen.py [pair_count] [seed]
+    pair_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    print(generate_haversine_data_json(pair_count, seed))
@@ -0,0 +1,238 @@
+from __future__ import annotations
+import os
+import re
+import mmap
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Any
+
+from dumb_json_parser import iter_events, map_source, EventType, SourceReader
+from haversine_gen import haversine_batch, HaversineBatch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+COLUMN_NAMES = ('x0', 'y0', 'x1', 'y1')
+
+# byte range each parallel task covers, small enough that a worker's columns stay modest
+PARALLEL_RANGE_SIZE = 16 * 1024 * 1024
+
+# smallest a pair can be on disk is {"x0":0,"y0":0,"x1":0,"y1":0}, the
+# generator writes full doubles so this guess is usually a little high
+BYTES_PER_PAIR_GUESS = 64
+
+NUMBER = rb'(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)'
+LIST_START = re.compile(rb'\s*\[\s*(\])?')
+PAIR = re.compile(
+    rb'\s*\{\s*"x0"\s*:\s*' + NUMBER +
+    rb'\s*,\s*"y0"\s*:\s*' + NUMBER +
+    rb'\s*,\s*"x1"\s*:\s*' + NUMBER +
+    rb'\s*,\s*"y1"\s*:\s*' + NUMBER +
+    rb'\s*\}\s*([,\]])'
+)
+TRAILING_SPACE = re.compile(rb'\s*\Z')
+
+@dataclass
+class HaversinePairs:
+    x0: Any
+    y0: Any
+    x1: Any
+    y1: Any
+
+    def __len__(self):
+        return len(self.x0)
+
+class ColumnBuffer:
+    """
+    Four float64 columns that are allocated up front and doubled when they fill
+    up. Backed by numpy when it is installed, array('d') otherwise.
+    """
+    def __init__(self, capacity: int, use_numpy: bool):
+        self.use_numpy = use_numpy
+        self.capacity = max(capacity, 16)
+        self.count = 0
+        self.columns = [self._allocate(self.capacity) for _ in COLUMN_NAMES]
+
+    def _allocate(self, size: int):
+        if self.use_numpy:
+            return np.empty(size, dtype=np.float64)
+        return array('d', bytes(8 * size))
+
+    def grow(self):
+        extra = self.capacity
+        if self.use_numpy:
+            self.columns = [np.concatenate((column, self._allocate(extra))) for column in self.columns]
+        else:
+            for column in self.columns:
+                column.frombytes(bytes(8 * extra))
+        self.capacity += extra
+
+    def finish(self) -> HaversinePairs:
+        count = self.count
+        if self.use_numpy:
+            columns = [column[:count] for column in self.columns]
+        else:
+            columns = self.columns
+            for column in columns:
+                del column[count:]
+        return HaversinePairs(*columns)
+
+def load_haversine_pairs(source: bytes | memoryview, use_numpy: bool | None = None) -> HaversinePairs:
+    """
+    Decode [{"x0":..,"y0":..,"x1":..,"y1":..}, ...] straight into four float
+    columns without building tokens or AST nodes. If the input does not have
+    exactly that shape it falls back to the streaming events.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    elif use_numpy and np is None:
+        raise ImportError("numpy is not installed")
+
+    buffer = ColumnBuffer(len(source) // BYTES_PER_PAIR_GUESS, use_numpy)
+    start = LIST_START.match(source)
+    if start is None:
+        raise SyntaxError("Expected a list of haversine pairs.")
+    if start.group(1):
+        _check_trailing(source, start.end())
+        return buffer.finish()
+
+    x0s, y0s, x1s, y1s = buffer.columns
+    match = PAIR.match
+    position = start.end()
+    index = 0
+    while True:
+        pair = match(source, position)
+        if pair is None:
+            return _load_from_events(source, use_numpy)
+        if index == buffer.capacity:
+            buffer.count = index
+            buffer.grow()
+            x0s, y0s, x1s, y1s = buffer.columns
+        x0, y0, x1, y1, separator = pair.groups()
+        x0s[index] = float(x0)
+        y0s[index] = float(y0)
+        x1s[index] = float(x1)
+        y1s[index] = float(y1)
+        index += 1
+        position = pair.end()
+        if separator == b']':
+            break
+
+    _check_trailing(source, position)
+    buffer.count = index
+    return buffer.finish()
+
+def _check_trailing(source: bytes | memoryview, position: int):
+    # same as iter_events, nothing but whitespace may follow the closing bracket
+    if TRAILING_SPACE.match(source, position) is None:
+        raise SyntaxError(f"Unexpected data after the list at byte {position}.")
+
+def _load_from_events(source: bytes | memoryview, use_numpy: bool) -> HaversinePairs:
+    """
+    Slow path for pair lists whose keys are reordered or carry extra members.
+    """
+    buffer = ColumnBuffer(len(source) // BYTES_PER_PAIR_GUESS, use_numpy)
+    column_for_key = {name: i for i, name in enumerate(COLUMN_NAMES)}
+    column = None
+    seen = 0
+    depth = 0
+
+    for event, value in iter_events(SourceReader(source)):
+        if event == EventType.START_OBJECT:
+            depth += 1
+            if depth == 1:
+                seen = 0
+                if buffer.count == buffer.capacity:
+                    buffer.grow()
+        elif event == EventType.END_OBJECT:
+            depth -= 1
+            if depth == 0:
+                if seen != len(COLUMN_NAMES):
+                    raise SyntaxError(f"Pair {buffer.count} is missing coordinates.")
+                buffer.count += 1
+        elif event == EventType.KEY:
+            column = column_for_key.get(value) if depth == 1 else None
+        elif event == EventType.NUMBER and column is not None:
+            buffer.columns[column][buffer.count] = value
+            seen += 1
+            column = None
+    return buffer.finish()
+
+def load_haversine_file(path: Path | str, use_numpy: bool | None = None) -> HaversinePairs:
+    with map_source(path) as source:
+        return load_haversine_pairs(source, use_numpy)
+
+def _sum_range(path: str, start: int, end: int, use_numpy: bool | None) -> tuple[int, float]:
+    """
+    Worker side of parallel_haversine_mean. Sums the distances of every pair
+    whose opening brace sits in [start, end).
+    """
+    x0s, y0s, x1s, y1s = array('d'), array('d'), array('d'), array('d')
+    match = PAIR.match
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        # resync, the first pair this range owns starts at the first brace after start
+        position = mapped.find(b'{', start, end)
+        while position != -1 and position < end:
+            pair = match(mapped, position)
+            if pair is None:
+                raise SyntaxError(f"Malformed haversine pair at byte {position}.")
+            x0, y0, x1, y1, _ = pair.groups()
+            x0s.append(float(x0))
+            y0s.append(float(y0))
+            x1s.append(float(x1))
+            y1s.append(float(y1))
+            position = mapped.find(b'{', pair.end())
+    batch = haversine_batch(x0s, y0s, x1s, y1s, use_numpy)
+    return batch.pair_count, batch.total
+
+def parallel_haversine_mean(
+        path: Path | str,
+        max_workers: int | None = None,
+        range_size: int = PARALLEL_RANGE_SIZE,
+        use_numpy: bool | None = None,
+        ) -> HaversineBatch:
+    """
+    Mean haversine distance of a big [{"x0":..,"y0":..,"x1":..,"y1":..}, ...]
+    file, parsed and summed by a process pool.
+
+    The file is cut into range_size byte ranges, a range owns the pairs whose
+    '{' falls inside it, which only works because pairs hold no nested objects
+    or strings with braces in them. Every worker maps the file itself, so the
+    pages are shared through the page cache and only offsets and
+    (count, total) tuples cross between processes. Partial sums are added up
+    in file order so a given range_size always gives the same result.
+    """
+    path = str(path)
+    size = os.path.getsize(path)
+    starts = range(0, size, range_size)
+    start_time = time.perf_counter()
+
+    pair_count = 0
+    total = 0.0
+    with ProcessPoolExecutor(max_workers) as executor:
+        partials = executor.map(
+            _sum_range,
+            [path] * len(starts),
+            starts,
+            [min(start + range_size, size) for start in starts],
+            [use_numpy] * len(starts),
+        )
+        for count, partial_total in partials:
+            pair_count += count
+            total += partial_total
+
+    seconds = time.perf_counter() - start_time
+    mean = total / pair_count if pair_count else 0.0
+    return HaversineBatch(None, mean, pair_count, seconds, total)
+
+if __name__ == "__main__":
+    pairs = load_haversine_file('haversine.json')
+    print(f"{len(pairs)} pairs")
+    for i in range(min(len(pairs), 4)):
+        print(pairs.x0[i], pairs.y0[i], pairs.x1[i], pairs.y1[i])
+    print(parallel_haversine_mean('haversine.json'))
@@ -0,0 +1,117 @@
+from __future__ import annotations
+import os
+import functools
+from time import perf_counter_ns
+from dataclasses import dataclass
+
+# PROFILER=0 in the environment swaps time_block for a shared do nothing
+# block, decided once at import so the disabled path has no checks in it
+PROFILER_ENABLED = os.environ.get('PROFILER', '1') != '0'
+
+@dataclass
+class Anchor:
+    name: str
+    hit_count: int = 0
+    # time spent in this block minus the blocks nested inside it
+    exclusive_ns: int = 0
+    # time spent in this block including nested blocks, recursion counted once
+    inclusive_ns: int = 0
+    processed_bytes: int = 0
+
+anchors: dict[str, Anchor] = {}
+_current_anchor: Anchor | None = None
+_profile_start = 0
+
+class TimeBlock:
+    """
+    Times everything inside a with statement against the anchor called name.
+    Also works as a decorator, each call then gets its own block.
+    """
+    __slots__ = ('anchor', 'byte_count', 'parent', 'old_inclusive_ns', 'start')
+
+    def __init__(self, name: str, byte_count: int = 0):
+        anchor = anchors.get(name)
+        if anchor is None:
+            anchor = anchors[name] = Anchor(name)
+        self.anchor = anchor
+        self.byte_count = byte_count
+
+    def __enter__(self):
+        global _current_anchor
+        self.parent = _current_anchor
+        self.old_inclusive_ns = self.anchor.inclusive_ns
+        _current_anchor = self.anchor
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _current_anchor
+        elapsed = perf_counter_ns() - self.start
+        anchor = self.anchor
+        _current_anchor = self.parent
+        if self.parent is not None:
+            self.parent.exclusive_ns -= elapsed
+        anchor.exclusive_ns += elapsed
+        anchor.inclusive_ns = self.old_inclusive_ns + elapsed
+        anchor.hit_count += 1
+        anchor.processed_bytes += self.byte_count
+        return False
+
+    def __call__(self, func):
+        name = self.anchor.name
+        byte_count = self.byte_count
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with TimeBlock(name, byte_count):
+                return func(*args, **kwargs)
+        return timed
+
+class NullBlock:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __call__(self, func):
+        return func
+
+NULL_BLOCK = NullBlock()
+
+if PROFILER_ENABLED:
+    def time_block(name: str, byte_count: int = 0) -> TimeBlock:
+        return TimeBlock(name, byte_count)
+else:
+    def time_block(name: str, byte_count: int = 0) -> NullBlock:
+        return NULL_BLOCK
+
+def begin_profile():
+    global _profile_start
+    anchors.clear()
+    _profile_start = perf_counter_ns()
+
+def format_profile() -> str:
+    total_ns = perf_counter_ns() - _profile_start
+    lines = [f"Total time: {total_ns / 1e6:.4f}ms"]
+    for anchor in anchors.values():
+        if not anchor.hit_count:
+            continue
+        percent = 100 * anchor.exclusive_ns / total_ns if total_ns else 0.0
+        line = f"  {anchor.name}[{anchor.hit_count}]: {anchor.exclusive_ns / 1e6:.4f}ms ({percent:.2f}%"
+        if anchor.inclusive_ns != anchor.exclusive_ns:
+            inclusive_percent = 100 * anchor.inclusive_ns / total_ns if total_ns else 0.0
+            line += f", {inclusive_percent:.2f}% w/children"
+        line += ")"
+        if anchor.processed_bytes:
+            megabytes = anchor.processed_bytes / (1024 * 1024)
+            seconds = anchor.inclusive_ns / 1e9
+            line += f"  {megabytes:.3f}mb at {megabytes / seconds if seconds else 0.0:.2f}mb/s"
+        lines.append(line)
+    return '\n'.join(lines)
+
+def end_and_print_profile():
+    if PROFILER_ENABLED:
+        print(format_profile())